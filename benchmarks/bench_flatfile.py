@@ -0,0 +1,84 @@
+"""
+Compares the flatfile tokenizer in honahlee_server.db.flatfile with the original
+character-at-a-time generator it replaced.
+
+Usage:
+    python benchmarks/bench_flatfile.py [objects] [value_length]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import generate
+from honahlee_server.db.flatfile import parse_flatfile
+
+
+def parse_flatfile_chars(path: str, chunk_size: int = 50):
+    """
+    The original tokenizer, kept here as the reference for output and timing.
+    """
+    f = open(path, encoding="latin_1")
+    scratch = ""
+    escaped = False
+    quoted = False
+
+    while buffer := f.read(chunk_size):
+        for c in buffer:
+            if c == "\r":
+                continue
+
+            if quoted:
+                if escaped:
+                    escaped = False
+                    scratch += c
+                else:
+                    if c == '"':
+                        quoted = False
+                        scratch += c
+                    elif c == "\\":
+                        escaped = True
+                    else:
+                        scratch += c
+            else:
+                if c == '"':
+                    quoted = True
+                    scratch += c
+                elif c == "\n":
+                    yield scratch
+                    scratch = ""
+                else:
+                    scratch += c
+    f.close()
+
+
+def timed(func, path):
+    start = time.perf_counter()
+    lines = list(func(path))
+    return time.perf_counter() - start, lines
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    value_length = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "outdb")
+        generate(path, count=count, value_length=value_length)
+        size = os.path.getsize(path)
+        print(f"Synthetic flatfile: {count} objects, {size / 1048576:.1f} MiB")
+
+        old_time, old_lines = timed(parse_flatfile_chars, path)
+        new_time, new_lines = timed(parse_flatfile, path)
+        if old_lines != new_lines:
+            print("MISMATCH: tokenizers disagree on output!")
+            sys.exit(1)
+        print(f"{len(new_lines)} lines, output identical")
+        print(f"  character generator: {old_time:8.3f}s  {size / old_time / 1048576:8.1f} MiB/s")
+        print(f"  regex scanner:       {new_time:8.3f}s  {size / new_time / 1048576:8.1f} MiB/s")
+        print(f"  speedup:             {old_time / new_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
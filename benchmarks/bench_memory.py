@@ -0,0 +1,87 @@
+"""
+Reports how much memory a loaded PennDB takes per object, for a synthetic dump.
+
+Each load mode runs in a fresh interpreter so that its peak RSS is its own. The retained size is
+the deep size of everything reachable from the database, since RSS alone hides how much of it is
+freed-but-unreturned parser garbage. Needs a Unix-like system for the resource module.
+
+Usage:
+    python benchmarks/bench_memory.py [objects] [attrs]
+
+The parallel mode loads eagerly with a pool of 4 worker processes. Its peak only counts this
+process, not the workers. The snapshot mode loads lazily through a snapshot, and runs twice: once
+to write the snapshot and once to read it back.
+"""
+import gc
+import os
+import sys
+import time
+import json
+import resource
+import tempfile
+import subprocess
+from types import ModuleType, FunctionType
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import generate
+
+
+def deep_size(root):
+    """
+    Sums sys.getsizeof() over every object reachable from root, counting shared objects once.
+    """
+    seen = set()
+    total = 0
+    pending = [root]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, (type, ModuleType, FunctionType)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return total
+
+
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def child(path, mode):
+    from honahlee_server.db.flatfile import PennDB
+    gc.collect()
+    before = peak_rss()
+    start = time.perf_counter()
+    db = PennDB.from_outdb(path, lazy=mode in ("lazy", "snapshot"), snapshot=(mode == "snapshot"),
+                           workers=4 if mode == "parallel" else 1)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss() - before
+    # The mapped file is not part of the heap.
+    db.buffer = None
+    print(json.dumps({"objects": len(db.objects), "elapsed": elapsed, "retained": deep_size(db), "peak": peak}))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    attrs = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "outdb")
+        generate(path, count=count, attrs=attrs, value_length=80)
+        print(f"Synthetic flatfile: {count} objects, {attrs} attributes each, {os.path.getsize(path) / 1048576:.1f} MiB")
+        for label, mode in (("eager", "eager"), ("lazy", "lazy"), ("parallel", "parallel"),
+                            ("snap-new", "snapshot"), ("snap-old", "snapshot")):
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", path, mode],
+                                    capture_output=True, text=True, check=True)
+            r = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"  {label:<8} {r['elapsed']:7.2f}s  retained {r['retained'] / 1048576:8.1f} MiB "
+                  f"({r['retained'] / r['objects']:7.0f} bytes/object)  peak {r['peak'] / 1048576:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,122 @@
+"""
+Times Parser.evaluate on ever longer think expressions, next to the original evaluator that
+sliced the remaining text and concatenated Text one character at a time.
+
+The original could not call functions, so the expressions stick to text, substitutions and
+brackets. Doubling the length should roughly double the time for a linear evaluator and quadruple
+it for a quadratic one.
+
+Usage:
+    python benchmarks/bench_parser.py [max_length]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.text import Text
+from honahlee_server.engine.parser import Parser
+from honahlee_server.engine.softcode import compile_softcode
+
+PHRASE = "The quick brown %n jumps over [the lazy] dog.%r "
+
+
+class Enactor:
+    name = "Tester"
+    relations = dict()
+
+    def __str__(self):
+        return "#1"
+
+
+class Core:
+    functions = dict()
+
+
+def evaluate_original(enactor, text, called_recursively=False, stop_at=None):
+    """
+    The original evaluation loop, cut down to what the expressions above use.
+    """
+    if stop_at is None:
+        stop_at = list()
+    out = Text()
+    remaining = text
+    escaped = False
+    stopped = None
+    i = -1
+    while i < len(remaining) - 1:
+        i += 1
+        c = remaining[i]
+        if escaped:
+            out += c
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif stop_at and c in stop_at:
+            remaining = remaining[i+1:]
+            stopped = c
+            break
+        elif c == '%':
+            sub = remaining[i:]
+            if sub.startswith('%n'):
+                out += enactor.name
+                remaining = sub[2:]
+            elif sub.startswith('%r'):
+                out += '\n'
+                remaining = sub[2:]
+            else:
+                out += '%'
+                remaining = sub[1:]
+            i = -1
+        elif c == '[':
+            evaled, remaining, stop_char = evaluate_original(enactor, remaining[i+1:], True, ']')
+            i = -1
+            out += evaled
+        else:
+            out += c
+    if stopped is None and remaining:
+        remaining = ''
+    return out, remaining, stopped
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    max_length = int(sys.argv[1]) if len(sys.argv) > 1 else 32000
+    enactor = Enactor()
+    parser = Parser(Core(), enactor, enactor, enactor)
+    print(f"{'chars':>8} {'original':>10} {'compile+run':>12} {'cached':>10}")
+    prev = None
+    length = 1000
+    while length <= max_length:
+        text = (PHRASE * (length // len(PHRASE) + 1))[:length]
+
+        def cold():
+            compile_softcode.cache_clear()
+            return parser.evaluate(text)[0]
+
+        old_time, old_out = timed(lambda: evaluate_original(enactor, text)[0])
+        new_time, new_out = timed(cold)
+        warm_time, _ = timed(lambda: parser.evaluate(text)[0])
+        if old_out.plain != new_out.plain:
+            print("MISMATCH: evaluators disagree on output!")
+            sys.exit(1)
+        line = f"{length:>8} {old_time:>9.4f}s {new_time:>11.4f}s {warm_time:>9.4f}s"
+        if prev:
+            line += f"   growth x{old_time / prev[0]:.1f} / x{new_time / prev[1]:.1f}"
+        print(line)
+        prev = (old_time, new_time)
+        length *= 2
+
+
+if __name__ == "__main__":
+    main()
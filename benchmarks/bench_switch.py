@@ -0,0 +1,70 @@
+"""
+Times switch() with 30 cases when its arguments are evaluated lazily, as it does now, against the
+same function evaluating every argument up front.
+
+Usage:
+    python benchmarks/bench_switch.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from honahlee_server.engine.parser import Parser
+from honahlee_server.engine.functions.base import FunctionTable
+from honahlee_server.engine.functions.control import CONTROL_FUNCTIONS, SwitchFunction
+
+CASES = 30
+
+
+class EagerSwitchFunction(SwitchFunction):
+    eval_args = True
+
+
+class Enactor:
+    name = "Tester"
+    relations = dict()
+
+    def __str__(self):
+        return "#1"
+
+
+class Core:
+    def __init__(self, switch):
+        self.functions = FunctionTable(CONTROL_FUNCTIONS)
+        self.functions.add(switch)
+
+
+def expression(match: int):
+    cases = ','.join(f"case {i},[if(or(0,{i}),result [and(1,{i})],never)]" for i in range(1, CASES + 1))
+    return f"switch(case {match},{cases},[if(1,default)])"
+
+
+def timed(core, text, iterations):
+    enactor = Enactor()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        # A fresh Parser each time, as each QueueEntry gets, so the invocation limit never trips.
+        out = Parser(core, enactor, enactor, enactor).evaluate(text)[0]
+    return time.perf_counter() - start, out.plain
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    eager = Core(EagerSwitchFunction)
+    lazy = Core(SwitchFunction)
+    print(f"switch() with {CASES} cases, {iterations} iterations")
+    for match in (1, CASES // 2, CASES, CASES + 1):
+        text = expression(match)
+        eager_time, eager_out = timed(eager, text, iterations)
+        lazy_time, lazy_out = timed(lazy, text, iterations)
+        if eager_out != lazy_out:
+            print(f"MISMATCH: {eager_out!r} != {lazy_out!r}")
+            sys.exit(1)
+        where = f"case {match}" if match <= CASES else "default"
+        print(f"  {where:>8}: eager {eager_time:7.3f}s  lazy {lazy_time:7.3f}s  speedup {eager_time / lazy_time:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
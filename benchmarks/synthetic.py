@@ -0,0 +1,114 @@
+"""
+Generates synthetic PennMUSH flatfiles for the benchmarks in this directory.
+
+The layout follows what PennMUSH writes with its labeled dump format: a header, the flag,
+power and attribute tables, then one !<dbref> block per object and the end-of-dump marker.
+"""
+import random
+
+TYPE_ROOM = 1
+TYPE_THING = 2
+TYPE_EXIT = 4
+TYPE_PLAYER = 8
+
+
+def quote(text: str) -> str:
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def write_header(out):
+    out.append("+V-2")
+    out.append("dbversion 6")
+    out.append(f"savedtime {quote('Sun Oct 18 12:00:00 2026')}")
+    for section, names in (("+FLAGS LIST", ("WIZARD", "ROYALTY", "DARK", "SAFE")), ("+POWER LIST", ("Guest", "Builder"))):
+        out.append(section)
+        out.append(f"flagcount {len(names)}")
+        for name in names:
+            out.append(f" name {quote(name)}")
+            out.append(f"  letter {quote(name[0])}")
+            out.append(f"  type {quote('THING PLAYER ROOM EXIT')}")
+            out.append(f"  perms {quote('trusted')}")
+            out.append(f"  negate_perms {quote('trusted')}")
+        out.append("flagaliascount 0")
+    out.append("+ATTRIBUTES LIST")
+    out.append("attrcount 1")
+    out.append(f" name {quote('DESCRIBE')}")
+    out.append(f"  flags {quote('no_command visual')}")
+    out.append("  creator #1")
+    out.append(f"  data {quote('')}")
+    out.append("attraliascount 0")
+
+
+def make_value(rng, length):
+    words = ["[ansi(hg,%0)]", "%r", "$+finger *:", "@pemit %#=", 'say "hi"', "\\", "lorem", "ipsum", "\r\n"]
+    out = list()
+    size = 0
+    while size < length:
+        word = rng.choice(words)
+        out.append(word)
+        size += len(word) + 1
+    return ' '.join(out)
+
+
+def write_object(out, rng, dbref, count, attrs, value_length):
+    kind = rng.choice((TYPE_ROOM, TYPE_THING, TYPE_THING, TYPE_EXIT, TYPE_EXIT, TYPE_EXIT, TYPE_PLAYER))
+    out.append(f"!{dbref}")
+    out.append(f"name {quote(f'Object {dbref}')}")
+    out.append(f"location #{rng.randrange(count)}")
+    out.append("contents #-1")
+    out.append(f"exits #{rng.randrange(count) if kind == TYPE_EXIT else -1}")
+    out.append("next #-1")
+    out.append(f"parent #{rng.randrange(dbref) if dbref and rng.random() < 0.5 else -1}")
+    # Like real dumps, exits carry no locks and some objects carry no attributes.
+    if kind == TYPE_EXIT:
+        out.append("lockcount 0")
+    else:
+        out.append("lockcount 1")
+        out.append(f" type {quote('Basic')}")
+        out.append("  creator #1")
+        out.append(f"  flags {quote('')}")
+        out.append("  derefs 0")
+        out.append(f"  key {quote('#TRUE')}")
+    out.append("owner #1")
+    out.append("zone #-1")
+    out.append("pennies 10")
+    out.append(f"type {kind}")
+    out.append(f"flags {quote(rng.choice(('', 'DARK', 'SAFE', 'DARK SAFE', 'WIZARD')))}")
+    out.append(f"powers {quote(rng.choice(('', '', 'Builder')))}")
+    out.append(f"warnings {quote('')}")
+    out.append("created 1600000000")
+    out.append("modified 1600000000")
+    if dbref % 10 == 9:
+        attrs = 0
+    out.append(f"attrcount {attrs}")
+    for i in range(attrs):
+        out.append(f" name {quote(f'D`ATTR{i}' if i % 3 else f'ATTR{i}')}")
+        out.append("  owner #1")
+        out.append(f"  flags {quote('no_command')}")
+        out.append("  derefs 0")
+        out.append(f"  value {quote(make_value(rng, value_length))}")
+
+
+def generate(path, count=10000, attrs=8, value_length=200, seed=0):
+    """
+    Writes a synthetic flatfile to path.
+
+    Args:
+        path (path-like): where to write.
+        count (int): number of objects.
+        attrs (int): attributes per object. Every tenth object has none.
+        value_length (int): approximate length of each attribute value.
+        seed (int): seed for the random generator, so runs are repeatable.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", encoding="latin_1", newline='') as f:
+        out = list()
+        write_header(out)
+        out.append(f"~{count}")
+        for dbref in range(count):
+            write_object(out, rng, dbref, count, attrs, value_length)
+            if len(out) > 10000:
+                f.write('\n'.join(out) + '\n')
+                out = list()
+        out.append("***END OF DUMP***")
+        f.write('\n'.join(out) + '\n')
@@ -40,6 +40,8 @@ class Application(BaseApplication):
         self.connections = dict()
 
         self.accounts = dict()
+        # The game's CmdQueue, once the game core has set one up.
+        self.cmdqueue = None
 
     async def joined(self, session, details):
         await super().joined(session, details)
@@ -66,6 +68,9 @@ class Application(BaseApplication):
         else:
             print(f"HUB RECEIVED UNKNOWN UPDATE: {kwargs}")
 
+    def rpc_queue_stats(self, *args, **kwargs):
+        return self.cmdqueue.stats() if self.cmdqueue else dict()
+
     def link_client(self, data):
         name = data['name']
         if (conn := self.connections.get(name, None)):
@@ -1,11 +1,68 @@
+import gc
+import os
+import sys
 import re
+import mmap
+import pickle
 import hashlib
+from bisect import bisect_left
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from types import MappingProxyType
+from typing import Optional
 from . ansi import AnsiString
 from shinma.utils import partial_match
 
+# Bump this whenever the pickled layout of PennDB or its objects changes.
+SNAPSHOT_VERSION = 5
+
+# Shared stand-ins for the many flag sets, link sets and attribute dicts that stay empty. Code that
+# fills them must replace them with a fresh container first.
+_EMPTY = frozenset()
+_EMPTY_MAP = MappingProxyType(dict())
+
+
+@lru_cache(maxsize=None)
+def flag_set(text: str) -> frozenset:
+    """
+    Turns a space-separated flag list into a frozenset of interned names. The same few flag lists
+    repeat across a whole dump, so every object with the same list shares one frozenset.
+    """
+    if not text:
+        return _EMPTY
+    return frozenset(sys.intern(f) for f in text.split(' ') if f)
+
+
+_RE_ATTR_PREFIX = re.compile(r"[\w`]*")
+
+
+@lru_cache(maxsize=1024)
+def attr_pattern(pattern: str):
+    """
+    Compiles an lattr() wildcard pattern. A `** matches any number of attribute tree levels, and
+    a * matches a run of word characters within one.
+
+    Returns:
+        tuple of (prefix, regex), where prefix is the uppercased literal text every match must
+            start with. It may be empty.
+    """
+    translated = pattern.replace('`**', r'`\S+').replace('*', r'\w+')
+    if '|' in translated:
+        # An alternation can match without the leading text at all.
+        prefix = ""
+    else:
+        prefix = _RE_ATTR_PREFIX.match(translated).group()
+        if prefix and translated[len(prefix):len(prefix)+1] in ('?', '+', '{'):
+            # The last character of the run is quantified, so it is not required.
+            prefix = prefix[:-1]
+        prefix = prefix.upper()
+    return prefix, re.compile(f"^{translated}$", flags=re.IGNORECASE)
+
 
 class FlatLine:
+    __slots__ = ("text", "header", "name", "value", "valtype", "depth")
 
     def __init__(self, text: str):
         self.text = text
@@ -21,7 +78,7 @@ class FlatLine:
         else:
             self.depth = len(text) - len(text.lstrip(' '))
             name, value = text.lstrip(' ').split(" ", 1)
-            self.name = name
+            self.name = sys.intern(name)
             if value.startswith('"'):
                 self.value = value[1:-1]
                 self.valtype = "text"
@@ -43,53 +100,107 @@ def parse_flatlines(generator: callable):
         return None
 
 
-def parse_flatfile(path: str, chunk_size: int = 50):
+# A logical line is any run of unquoted text and complete quoted values, up to an unquoted newline.
+# The quoted value patterns are written "unrolled" so that they rarely need to backtrack.
+_RE_LINE = re.compile(rb'([^"\n]*(?:"[^"\\]*(?:\\\r*.[^"\\]*)*"[^"\n]*)*)\n', flags=re.DOTALL)
+_RE_QUOTED = re.compile(rb'"[^"\\]*(?:\\\r*.[^"\\]*)*"', flags=re.DOTALL)
+_RE_ESCAPE = re.compile(rb'\\\r*(.)', flags=re.DOTALL)
+_BLOCK_SIZE = 1 << 20
+
+
+def _unescape(match):
+    # Splitting on a pattern with one capture group keeps only the escaped characters.
+    return b''.join(_RE_ESCAPE.split(match.group()))
+
+
+def scan_flatfile(buffer, start: int = 0, end: int = None):
+    """
+    Scans a bytes-like PennMUSH flatfile buffer (bytes or mmap) for logical lines.
+
+    Quoted values may contain escaped quotes and raw newlines; those are folded into the line
+    they belong to and the escaping backslashes are removed. Any \r is dropped.
+
+    The buffer is cut into blocks of whole physical lines which are split in one go. Only lines
+    holding an escape or an unbalanced quote are handed to the line regex, which finds where the
+    logical line really ends.
+
+    Args:
+        buffer (bytes-like): the data to scan.
+        start (int): offset to begin scanning at. Must be the start of a line.
+        end (int): offset to stop scanning at. Defaults to the end of the buffer.
+
+    Returns:
+        generator of (offset, line) tuples, where offset is the position of the line's first byte
+        and line is the bytes of the line without its terminating newline.
+    """
+    if end is None:
+        end = len(buffer)
+    pos = start
+    match_line = _RE_LINE.match
+
+    while pos < end:
+        if (stop := buffer.rfind(b'\n', pos, min(pos + _BLOCK_SIZE, end))) == -1:
+            if (stop := buffer.find(b'\n', pos, end)) == -1:
+                # Anything after the final newline is not a complete line and is ignored.
+                return
+        offset = pos
+        skip_to = pos
+        for line in buffer[pos:stop].split(b'\n'):
+            line_start = offset
+            offset += len(line) + 1
+            if line_start < skip_to:
+                # Still inside a logical line that was already yielded.
+                continue
+            if 34 in line and (92 in line or line.count(b'"') % 2):  # '"' and '\\'
+                if not (match := match_line(buffer, line_start, end)):
+                    # An unterminated quote runs off the end of the data, so there are no complete lines left.
+                    return
+                skip_to = match.end()
+                line = _RE_QUOTED.sub(_unescape, match.group(1))
+            if 13 in line:  # '\r'
+                line = line.replace(b'\r', b'')
+            yield line_start, line
+        pos = max(offset, skip_to)
+
+
+def open_flatfile(path: str):
+    """
+    Memory-maps a flatfile read-only.
+
+    Args:
+        path (path-like): the file to open.
+
+    Returns:
+        mmap of the file, or empty bytes if the file is empty.
+    """
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def parse_flatfile(path: str):
     """
     Opens up a PennMUSH flatfile and parses it generator-style so that escaped values with newlines are treated as single lines.
 
     This totally ignores any \r it sees but considers a \n a newline.
 
+    The file is memory-mapped and scanned by scan_flatfile(), so long values are sliced out in
+    whole runs rather than built up a character at a time.
+
     Args:
         path (path-like): the file to open.
-        chunk_size (int): bytes-at-a-time to read the file
 
     Returns:
         generator of parsed lines.
     """
-    f = open(path, encoding="latin_1")
-    scratch = ""
-    escaped = False
-    quoted = False
-
-    while buffer := f.read(chunk_size):
-        for c in buffer:
-            # just ignore any CR's we see. We only care about LF.
-            if c == "\r":
-                continue
-
-            if quoted:
-                if escaped:
-                    escaped = False
-                    scratch += c
-                else:
-                    if c == '"':
-                        quoted = False
-                        scratch += c
-                    elif c == "\\":
-                        escaped = True
-                    else:
-                        scratch += c
-            else:
-                if c == '"':
-                    quoted = True
-                    scratch += c
-                elif c == "\n":
-                    yield scratch
-                    scratch = ""
-                else:
-                    scratch += c
-    else:
-        return None
+    buffer = open_flatfile(path)
+    try:
+        for offset, line in scan_flatfile(buffer):
+            yield line.decode("latin_1")
+    finally:
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
 
 
 class Flag:
@@ -103,6 +214,12 @@ class Flag:
 
         self.objects = set()
 
+    def __getstate__(self):
+        # objects is rebuilt by PennDB.setup().
+        state = dict(self.__dict__)
+        state["objects"] = set()
+        return state
+
     def set_line(self, line: FlatLine):
         if line.name == "letter":
             self.letter = line.value
@@ -134,38 +251,68 @@ class Attribute:
 
 
 class ObjAttribute:
+    __slots__ = ("name", "raw", "_value", "owner", "flags", "derefs")
+
     def __init__(self, name):
-        self.name = name
-        self.value = ""
+        self.name = sys.intern(name)
+        # The value's markup as it appears in the dump. It's only decoded into an AnsiString
+        # when .value is first read, since most attributes never are.
+        self.raw = ""
+        self._value = None
         self.owner = -1
-        self.flags = set()
+        self.flags = _EMPTY
         self.derefs = -1
 
+    def __getstate__(self):
+        # Pickle whichever form of the value exists, never both.
+        raw = self.raw if self._value is None else None
+        return self.name, raw, self._value, self.owner, self.flags, self.derefs
+
+    def __setstate__(self, state):
+        self.name, self.raw, self._value, self.owner, self.flags, self.derefs = state
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = AnsiString.from_markup(self.raw)
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    def decode(self):
+        return self.value
+
     def set_line(self, line: FlatLine):
 
         if line.name == "owner":
             self.owner = line.value
         elif line.name == "flags":
-            self.flags = set(line.value.split(' '))
+            self.flags = flag_set(line.value)
         elif line.name == "derefs":
             self.derefs = line.value
         elif line.name == "value":
-            self.value = AnsiString.from_markup(line.value)
+            self.raw = line.value
+            self._value = None
 
 
 class ObjLock:
+    __slots__ = ("name", "creator", "flags", "derefs", "key", "value")
+
     def __init__(self, name):
-        self.name = name
+        self.name = sys.intern(name)
         self.creator = -1
-        self.flags = set()
+        self.flags = _EMPTY
         self.derefs = -1
         self.key = ""
+        self.value = ""
 
     def set_line(self, line: FlatLine):
         if line.name == "creator":
             self.creator = line.value
         elif line.name == "flags":
-            self.flags = set(line.value.split(' '))
+            self.flags = flag_set(line.value)
         elif line.name == "derefs":
             self.derefs = line.value
         elif line.name == "value":
@@ -173,6 +320,11 @@ class ObjLock:
 
 
 class DbObject:
+    __slots__ = ("db", "id", "name", "location", "exits", "parent", "owner", "zone", "pennies", "type",
+                 "flags", "powers", "warnings", "created", "modified", "_attributes", "_locks", "span",
+                 "children", "contents", "entrances", "parent_obj", "owner_obj", "zone_obj",
+                 "location_obj", "exits_obj", "owns", "zoned", "_attr_keys", "_inherited", "_resolved")
+
     def __init__(self, db, dbref: int):
         self.db = db
         self.id = dbref
@@ -185,28 +337,78 @@ class DbObject:
         self.zone = -1
         self.pennies = 0
         self.type = -1
-        self.flags = set()
-        self.powers = set()
-        self.warnings = set()
+        self.flags = _EMPTY
+        self.powers = _EMPTY
+        self.warnings = _EMPTY
         self.created = -1
         self.modified = -1
-        self.attributes = dict()
-        self.locks = dict()
-
-        self.children = set()
-        self.contents = set()
-        self.entrances = set()
+        self._attributes = _EMPTY_MAP
+        self._locks = _EMPTY_MAP
+        # (start, end) byte range of this object's block in the db's buffer, while its attributes
+        # and locks have yet to be loaded from it.
+        self.span = None
+
+        self.children = _EMPTY
+        self.contents = _EMPTY
+        self.entrances = _EMPTY
         self.parent_obj = None
         self.owner_obj = None
         self.zone_obj = None
         self.location_obj = None
         self.exits_obj = None
-        self.owns = set()
-        self.zoned = set()
+        self.owns = _EMPTY
+        self.zoned = _EMPTY
+
+        # Sorted attribute names and the merged view of this object's ancestry for lattr(), and
+        # attribute names already looked up through the ancestry by get(). All are rebuilt on demand
+        # after attributes_changed() or inheritance_changed() clears them.
+        self._attr_keys = None
+        self._inherited = None
+        self._resolved = None
+
+    # Object references filled in by PennDB.setup(). They're rebuilt from the dbref fields, never pickled.
+    _links = ("children", "contents", "entrances", "owns", "zoned")
+    _link_objs = ("parent_obj", "owner_obj", "zone_obj", "location_obj", "exits_obj")
+    # span is pickled too, so an object that was never loaded stays lazy in a snapshot.
+    _pickled = ("id", "name", "location", "exits", "parent", "owner", "zone", "pennies", "type", "flags",
+                "powers", "warnings", "created", "modified", "_attributes", "_locks", "span")
 
     def __repr__(self):
         return f"<DbObj {self.type} - {self.dbref}: {self.name}>"
 
+    def __getstate__(self):
+        # The shared _EMPTY_MAP can't be pickled, so it's stored as None and restored on load.
+        values = tuple(None if (v := getattr(self, k)) is _EMPTY_MAP else v for k in self._pickled)
+        return values, getattr(self, "__dict__", None)
+
+    def __setstate__(self, state):
+        values, extra = state
+        self.db = None
+        for k, v in zip(self._pickled, values):
+            setattr(self, k, v)
+        if self._attributes is None:
+            self._attributes = _EMPTY_MAP
+        if self._locks is None:
+            self._locks = _EMPTY_MAP
+        for k in self._links:
+            setattr(self, k, _EMPTY)
+        for k in self._link_objs:
+            setattr(self, k, None)
+        self._attr_keys = None
+        self._inherited = None
+        self._resolved = None
+        if extra:
+            self.__dict__.update(extra)
+
+    def link(self, name: str, obj: "DbObject"):
+        """
+        Adds obj to one of the link sets, such as children or contents, creating it on first use.
+        """
+        if (found := getattr(self, name)) is _EMPTY:
+            found = set()
+            setattr(self, name, found)
+        found.add(obj)
+
     @property
     def dbref(self):
         return f"#{self.id}"
@@ -215,10 +417,121 @@ class DbObject:
     def objid(self):
         return f"#{self.id}:{self.created}"
 
+    @property
+    def attributes(self):
+        if self.span:
+            self.load_body()
+        return self._attributes
+
+    @property
+    def locks(self):
+        if self.span:
+            self.load_body()
+        return self._locks
+
     @classmethod
     def from_lines(cls, db, dbref, lines):
         obj = cls(db, dbref)
+        obj.load_lines(lines)
+        return obj
 
+    @classmethod
+    def from_span(cls, db, dbref, start, end):
+        """
+        Creates an object whose attributes and locks stay in db.buffer until first accessed.
+        Its header fields must still be fed in through set_line().
+        """
+        obj = cls(db, dbref)
+        obj.span = (start, end)
+        return obj
+
+    def load_body(self):
+        """
+        Parses the attributes and locks of an object created by from_span().
+        """
+        start, end = self.span
+        self.span = None
+        self.load_lines(self.db.read_lines(start, end), header=False)
+
+    def set_attr(self, attr):
+        """
+        Adds or replaces an attribute. Use this, or call attributes_changed() after editing
+        .attributes directly, so that lattr() sees the change.
+        """
+        if (attributes := self.attributes) is _EMPTY_MAP:
+            attributes = self._attributes = dict()
+        attributes[attr.name] = attr
+        self.attributes_changed()
+
+    def del_attr(self, name: str):
+        if (attributes := self.attributes) is _EMPTY_MAP:
+            return None
+        if (found := attributes.pop(name.upper(), None)):
+            self.attributes_changed()
+        return found
+
+    def attributes_changed(self):
+        self._attr_keys = None
+        self.inheritance_changed()
+
+    def inheritance_changed(self):
+        """
+        Drops the cached inherited attributes of this object and of everything descended from it.
+        """
+        pending = [self]
+        seen = set()
+        while pending:
+            obj = pending.pop()
+            if obj in seen:
+                continue
+            seen.add(obj)
+            obj._inherited = None
+            obj._resolved = None
+            pending.extend(obj.children)
+
+    def set_parent(self, parent: Optional["DbObject"]):
+        if self.parent_obj and self.parent_obj.children is not _EMPTY:
+            self.parent_obj.children.discard(self)
+        self.parent_obj = parent
+        self.parent = parent.id if parent else -1
+        if parent:
+            parent.link("children", self)
+        self.inheritance_changed()
+
+    def attribute_keys(self):
+        """
+        Returns:
+            sorted list of this object's attribute names.
+        """
+        if self._attr_keys is None:
+            self._attr_keys = sorted(self.attributes)
+        return self._attr_keys
+
+    def inherited_attributes(self):
+        """
+        Merges the attributes of this object and its ancestors, nearer objects taking precedence.
+        The result is cached until an attribute or parent anywhere in the chain changes.
+
+        Returns:
+            tuple of (dict of name to attribute, sorted list of names).
+        """
+        if self._inherited is None:
+            chain = self.ancestors(reversed=True)
+            chain.append(self)
+            merged = dict()
+            for obj in chain:
+                merged.update(obj.attributes)
+            self._inherited = (merged, sorted(merged))
+        return self._inherited
+
+    def decode_attributes(self):
+        """
+        Decodes every attribute value now instead of on first access.
+        """
+        for attr in self.attributes.values():
+            attr.decode()
+
+    def load_lines(self, lines, header=True):
         attr = None
         lock = None
 
@@ -232,22 +545,29 @@ class DbObject:
                 else:
                     if section != "header":
                         section = "header"
-                    obj.set_line(line)
+                    if header:
+                        self.set_line(line)
             if line.depth == 1:
                 if line.name in ("name", "type"):
                     if section == "attributes":
-                        attr = db.attr_class(line.value)
-                        obj.attributes[attr.name] = attr
+                        attr = self.db.attr_class(line.value)
+                        if self._attributes is _EMPTY_MAP:
+                            self._attributes = dict()
+                        self._attributes[attr.name] = attr
                     elif section == "locks":
                         lock = ObjLock(line.value)
-                        obj.locks[lock.name] = lock
+                        if self._locks is _EMPTY_MAP:
+                            self._locks = dict()
+                        self._locks[lock.name] = lock
             if line.depth == 2:
                 if section == "attributes":
                     attr.set_line(line)
                 elif section == "locks":
                     lock.set_line(line)
-
-        return obj
+        # Nothing can have inherited from attributes that weren't loaded yet, so only this
+        # object's own index needs dropping.
+        self._attr_keys = None
+        self._inherited = None
 
     def set_line(self, line: FlatLine):
         if line.name == "name":
@@ -263,11 +583,11 @@ class DbObject:
         elif line.name == "type":
             self.type = line.value
         elif line.name == "flags":
-            self.flags = set(line.value.split(' '))
+            self.flags = flag_set(line.value)
         elif line.name == "powers":
-            self.powers = set(line.value.split(' '))
+            self.powers = flag_set(line.value)
         elif line.name == "warnings":
-            self.warnings = set(line.value.split(' '))
+            self.warnings = flag_set(line.value)
         elif line.name == "created":
             self.created = line.value
         elif line.name == "modified":
@@ -279,18 +599,33 @@ class DbObject:
         uattr = attr.upper()
         if (found := self.attributes.get(uattr, None)):
             return found
-        else:
-            if inherit and self.parent_obj:
-                return self.parent_obj.get(uattr, default=default)
-        return default
+        if not inherit or not self.parent_obj:
+            return default
+        # Whatever the ancestry resolves a name to, found or not, is remembered until
+        # inheritance_changed() says otherwise.
+        if self._resolved is None:
+            self._resolved = dict()
+        elif uattr in self._resolved:
+            return self._resolved[uattr] or default
+        for ancestor in self.ancestors():
+            if (found := ancestor.attributes.get(uattr, None)):
+                break
+        self._resolved[uattr] = found
+        return found or default
 
     def ancestors(self, reversed=False):
+        """
+        Lists this object's parent, grandparent and so on. Stops early at a parent loop or after
+        db.max_parent_depth levels, as old dumps can hold corrupt parent chains.
+        """
         out = list()
-        if self.parent_obj:
-            parent = self.parent_obj
+        seen = {self}
+        limit = self.db.max_parent_depth
+        parent = self.parent_obj
+        while parent and parent not in seen and len(out) < limit:
             out.append(parent)
-            while (parent := parent.parent_obj):
-                out.append(parent)
+            seen.add(parent)
+            parent = parent.parent_obj
         if reversed:
             out.reverse()
         return out
@@ -298,16 +633,19 @@ class DbObject:
     def lattr(self, pattern, inherit=False):
         if not pattern:
             return dict()
-        pattern = pattern.replace('`**', '`\S+').replace('*', '\w+')
-        re_pattern = re.compile(f"^{pattern}$", flags=re.IGNORECASE)
-        out = dict()
+        prefix, re_pattern = attr_pattern(pattern)
         if inherit:
-            ancestors = self.ancestors(reversed=True)
-            ancestors.append(self)
+            attributes, keys = self.inherited_attributes()
         else:
-            ancestors = [self]
-        for ancestor in ancestors:
-            out.update({k: v for k, v in ancestor.attributes.items() if re_pattern.match(k)})
+            attributes, keys = self.attributes, self.attribute_keys()
+        out = dict()
+        # Only the names sharing the pattern's literal prefix can match, and they sort together.
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            k = keys[i]
+            if not k.startswith(prefix):
+                break
+            if re_pattern.match(k):
+                out[k] = attributes[k]
         return out
 
     def lattrp(self, pattern):
@@ -317,6 +655,8 @@ class DbObject:
 class PennDB:
     obj_class = DbObject
     attr_class = ObjAttribute
+    # PennMUSH's own default limit on parent chains.
+    max_parent_depth = 10
 
     def __init__(self):
         self.bitflags = 0
@@ -330,13 +670,131 @@ class PennDB:
         self.type_index = defaultdict(set)
         self.dbrefs = dict()
         self.objids = dict()
+        # The memory-mapped flatfile that lazily loaded objects read their attributes from.
+        self.buffer = None
+
+    def __getstate__(self):
+        # The indexes are rebuilt by setup() on load.
+        state = dict(self.__dict__)
+        state["buffer"] = None
+        state["type_index"] = defaultdict(set)
+        state["dbrefs"] = dict()
+        state["objids"] = dict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for obj in self.objects.values():
+            obj.db = self
+        self.setup()
+
+    @staticmethod
+    def snapshot_path(path: str):
+        return f"{path}.snapshot"
+
+    @staticmethod
+    def snapshot_key(path: str):
+        """
+        Identifies a flatfile by size, modification time and SHA1 hash.
+        """
+        st = os.stat(path)
+        check = hashlib.sha1()
+        with open(path, "rb") as f:
+            while (chunk := f.read(1 << 20)):
+                check.update(chunk)
+        return st.st_size, st.st_mtime_ns, check.hexdigest()
+
+    def save_snapshot(self, path: str):
+        """
+        Pickles this database next to the flatfile at path, so that load_snapshot() can skip
+        parsing it again. Objects whose bodies were never loaded are saved as their headers and
+        byte ranges, which stay valid as long as the flatfile is unchanged.
+
+        Args:
+            path (path-like): the flatfile this database was loaded from.
+        """
+        key = self.snapshot_key(path)
+        out_path = self.snapshot_path(path)
+        tmp_path = f"{out_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((SNAPSHOT_VERSION, key), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, out_path)
+        except BaseException:
+            # Don't leave a half-written snapshot behind.
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load_snapshot(cls, path: str, lazy: bool = False, workers: int = 1):
+        """
+        Loads the snapshot written by save_snapshot() for the flatfile at path. Objects saved
+        with only their byte ranges are loaded as from_outdb() would with the same lazy and
+        workers arguments.
+
+        Args:
+            path (path-like): the flatfile.
+            lazy (bool): If True, leave those objects to be loaded from the mapped file on access.
+            workers (int): If more than 1 and not lazy, load them with a process pool.
+
+        Returns:
+            PennDB (or subclass) instance, or None if there is no snapshot or it does not match
+                the flatfile's current size, modification time and hash.
+        """
+        snap_path = cls.snapshot_path(path)
+        if not os.path.exists(snap_path):
+            return None
+        st = os.stat(path)
+        try:
+            with open(snap_path, "rb") as f:
+                version, key = pickle.load(f)
+                if version != SNAPSHOT_VERSION or key[:2] != (st.st_size, st.st_mtime_ns):
+                    return None
+                if key != cls.snapshot_key(path):
+                    return None
+                # Unpickling creates millions of objects and none of them are garbage yet, so
+                # don't let the cyclic collector keep rescanning them all while it does.
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    db = pickle.load(f)
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+        except Exception as e:
+            print(f"Could not load PennDB snapshot {snap_path}: {e}")
+            return None
+        if not isinstance(db, cls):
+            return None
+        if any(obj.span for obj in db.objects.values()):
+            if lazy:
+                db.buffer = open_flatfile(path)
+            elif workers > 1:
+                db.load_parallel(path, workers)
+            else:
+                db.buffer = open_flatfile(path)
+                for obj in db.objects.values():
+                    if obj.span:
+                        obj.load_body()
+                if isinstance(db.buffer, mmap.mmap):
+                    db.buffer.close()
+                db.buffer = None
+        return db
+
+    def read_lines(self, start: int, end: int):
+        for offset, line in scan_flatfile(self.buffer, start, end):
+            yield FlatLine(line.decode("latin_1"))
 
     def setup(self):
         for k, v in self.objects.items():
             self.type_index[v.type].add(v)
 
             if (found := self.objects.get(v.location, None)):
-                found.contents.add(v)
+                found.link("contents", v)
                 v.location_obj = found
 
             if (found := self.objects.get(v.exits, None)):
@@ -344,15 +802,15 @@ class PennDB:
 
             if (parent := self.objects.get(v.parent, None)):
                 v.parent_obj = parent
-                parent.children.add(v)
+                parent.link("children", v)
 
             if (zone := self.objects.get(v.zone, None)):
                 v.zone_obj = zone
-                zone.zoned.add(v)
+                zone.link("zoned", v)
 
             if (owner := self.objects.get(v.owner, None)):
                 v.owner_obj = owner
-                owner.owns.add(v)
+                owner.link("owns", v)
 
             for fname in v.flags:
                 if (flag := self.flags.get(fname, None)):
@@ -366,17 +824,53 @@ class PennDB:
             self.objids[v.objid] = v
 
     @classmethod
-    def from_outdb(cls, path: str):
+    def from_outdb(cls, path: str, lazy: bool = False, snapshot: bool = False, workers: int = 1):
+        """
+        Loads a PennMUSH flatfile.
+
+        Args:
+            path (path-like): the file to load.
+            lazy (bool): If True, only the header fields of each object are parsed up front. The file
+                stays memory-mapped, and an object's attributes and locks are parsed from its byte
+                range the first time they're accessed.
+            snapshot (bool): If True, load from the snapshot next to the file when it is still
+                current. Otherwise parse the file and write a new snapshot. With lazy, that
+                snapshot only holds headers and byte ranges, so bodies stay lazy either way.
+            workers (int): If more than 1 and not lazy, the attributes and locks of every object
+                are parsed and their values decoded by a pool of this many processes. Header fields
+                are still parsed here. Otherwise values are decoded on first access.
+
+        Returns:
+            PennDB (or subclass) instance.
+        """
+        if snapshot:
+            if (db := cls.load_snapshot(path, lazy=lazy, workers=workers)):
+                return db
+            db = cls.from_outdb(path, lazy=lazy, workers=workers)
+            try:
+                db.save_snapshot(path)
+            except (OSError, pickle.PicklingError, TypeError) as e:
+                print(f"Could not save PennDB snapshot for {path}: {e}")
+            return db
+
         db = cls()
         flag_cur = None
         attr_cur = None
         section = "header"
 
         header_section = list()
-        obj_storage = defaultdict(list)
+        obj_lines = list()
         cur_obj = -1
+        lazy_obj = None
+        parallel = workers > 1 and not lazy
 
-        for i, line in enumerate(parse_flatlines(parse_flatfile(path))):
+        buffer = open_flatfile(path)
+
+        for offset, text in scan_flatfile(buffer):
+            if lazy_obj and text[:1] == b' ':
+                # Attribute and lock lines are left in the buffer until the object is asked for them.
+                continue
+            line = FlatLine(text.decode("latin_1"))
 
             if section == "header":
                 if line.text.startswith(("+V-")):
@@ -468,18 +962,70 @@ class PennDB:
 
             if section == "objects":
                 if line.depth == 0 and line.header:
+                    if lazy_obj:
+                        lazy_obj.span = (lazy_obj.span[0], offset)
+                        lazy_obj = None
+                    if obj_lines:
+                        # Build each object as soon as its block ends, rather than holding every line
+                        # of the dump until the end.
+                        db.objects[cur_obj] = cls.obj_class.from_lines(db, cur_obj, obj_lines)
+                        obj_lines = list()
                     cur_obj = line.value
-                elif line.depth == 0 and line.text.startswith("***END OF DUMP"):
-                    break
+                    if line.text.startswith("***END OF DUMP"):
+                        break
+                    if (lazy or parallel) and cur_obj is not None:
+                        lazy_obj = cls.obj_class.from_span(db, cur_obj, offset, len(buffer))
+                        db.objects[cur_obj] = lazy_obj
+                elif lazy_obj:
+                    if line.name not in ("attrcount", "lockcount"):
+                        lazy_obj.set_line(line)
                 else:
-                    obj_storage[cur_obj].append(line)
+                    obj_lines.append(line)
 
-        for k, v in obj_storage.items():
-            db.objects[k] = cls.obj_class.from_lines(db, k, v)
+        if obj_lines:
+            db.objects[cur_obj] = cls.obj_class.from_lines(db, cur_obj, obj_lines)
+
+        if parallel:
+            db.load_parallel(path, workers)
+
+        if lazy:
+            db.buffer = buffer
+        elif isinstance(buffer, mmap.mmap):
+            buffer.close()
 
         db.setup()
         return db
 
+    def decode_all(self):
+        """
+        Decodes every attribute value of every object, for exports that will touch them all anyway.
+        """
+        for obj in self.objects.values():
+            obj.decode_attributes()
+
+    def load_parallel(self, path: str, workers: int):
+        """
+        Loads the attributes and locks of every object still holding a span, using a process pool.
+        The workers also decode every attribute value, as that is most of the work.
+
+        Args:
+            path (path-like): the flatfile the spans refer to.
+            workers (int): number of processes.
+        """
+        spans = [(k, *v.span) for k, v in self.objects.items() if v.span]
+        if not spans:
+            return
+        # Several chunks per worker keeps them all busy when some objects are far bigger than others.
+        chunk_size = max(1, len(spans) // (workers * 4))
+        chunks = [spans[i:i+chunk_size] for i in range(0, len(spans), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in executor.map(_load_bodies, repeat(self.__class__), repeat(path), chunks):
+                for dbref, attributes, locks in results:
+                    obj = self.objects[dbref]
+                    obj._attributes = _EMPTY_MAP if attributes is None else attributes
+                    obj._locks = _EMPTY_MAP if locks is None else locks
+                    obj.span = None
+
     def isdbref(self, dbref):
         return self.dbrefs.get(dbref, None)
 
@@ -497,6 +1043,31 @@ class PennDB:
             return self.isdbref(dbref)
 
 
+def _load_bodies(db_class, path: str, spans):
+    """
+    Process pool worker for PennDB.load_parallel(). Parses each (dbref, start, end) span of the
+    flatfile at path into attributes and locks.
+
+    Returns:
+        list of (dbref, attributes, locks) tuples. The shared _EMPTY_MAP can't be pickled, so it's
+            sent back as None.
+    """
+    db = db_class()
+    db.buffer = open_flatfile(path)
+    out = list()
+    try:
+        for dbref, start, end in spans:
+            obj = db.obj_class.from_span(db, dbref, start, end)
+            obj.load_body()
+            obj.decode_attributes()
+            out.append((dbref, None if obj._attributes is _EMPTY_MAP else obj._attributes,
+                        None if obj._locks is _EMPTY_MAP else obj._locks))
+    finally:
+        if isinstance(db.buffer, mmap.mmap):
+            db.buffer.close()
+    return out
+
+
 def check_password(old_hash, password):
     if not old_hash:
         return False
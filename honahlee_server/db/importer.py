@@ -1,3 +1,10 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import traceback
+from collections import defaultdict
 from . flatfile import PennDB
 from shinma.utils import partial_match
 
@@ -45,14 +52,199 @@ class VolDB(PennDB):
         return {k: v for k, v in self.list_things().items() if v.get('D`DISTRICT', inherit=False)}
 
 
+class PhaseStats:
+    """
+    Progress and throughput of one import phase.
+    """
+
+    def __init__(self, name: str, total: int):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.resumed = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self):
+        if not (elapsed := self.elapsed):
+            return 0.0
+        return self.done / elapsed
+
+    def __str__(self):
+        out = f"{self.name}: {self.done}/{self.total} in {self.elapsed:.1f}s ({self.rate:.0f}/s)"
+        if self.resumed:
+            out += f", {self.resumed} imported previously"
+        return out
+
+
 class Importer:
+    # Objects imported between checkpoints and trips back to the event loop.
+    batch_size = 250
+    # Seconds between progress reports within a phase.
+    report_interval = 5.0
+
     def __init__(self, connection, path):
-        self.db = VolDB.from_outdb(path)
+        self.path = path
+        self.db = VolDB.from_outdb(path, lazy=True, snapshot=True)
         self.connection = connection
         self.core = connection.core
         connection.penn = self
+        # dbrefs that have been fully imported, and the names of finished phases. Both are logged
+        # to the checkpoint file so an interrupted import picks up where it stopped.
         self.complete = set()
+        self.phases = set()
+        # The phase that is running, and the dbrefs it has imported since the last checkpoint.
+        self.running = None
+        self.unsaved = list()
+        self.stats = dict()
         self.obj_map = dict()
+        self.districts = dict()
+        self.task = None
+        self.load_checkpoint()
+
+    @property
+    def checkpoint_path(self):
+        return f"{self.path}.checkpoint"
+
+    def load_checkpoint(self):
+        """
+        Replays the checkpoint log. Each line is a JSON object naming a phase, with either the
+        dbrefs one of its batches imported or a note that the phase finished.
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return
+        imported = defaultdict(list)
+        finished = set()
+        with open(self.checkpoint_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash.
+                    continue
+                if entry.get("finished"):
+                    finished.add(entry["phase"])
+                else:
+                    imported[entry["phase"]].extend(entry.get("complete", []))
+        survivors = defaultdict(list)
+        vanished = False
+        for phase, dbrefs in imported.items():
+            for dbref in dbrefs:
+                # Anything that was imported but has since vanished from the game gets imported
+                # again, and so does the whole phase it belonged to.
+                if (dbobj := self.db.find_obj(dbref)) and (obj := self.core.objects.get(dbobj.objid, None)):
+                    self.obj_map[dbref] = obj
+                    self.complete.add(dbref)
+                    survivors[phase].append(dbref)
+                else:
+                    finished.discard(phase)
+                    vanished = True
+        self.phases.update(finished)
+        if vanished:
+            self.compact_checkpoint(survivors)
+
+    def compact_checkpoint(self, survivors):
+        """
+        Rewrites the log so it only holds what survived, after objects vanished from the game.
+
+        Args:
+            survivors (dict): phase name -> dbrefs it imported that still exist.
+        """
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for phase, dbrefs in survivors.items():
+                f.write(json.dumps({"phase": phase, "complete": dbrefs}) + "\n")
+            for phase in sorted(self.phases):
+                f.write(json.dumps({"phase": phase, "finished": True}) + "\n")
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def save_checkpoint(self, finished: bool = False):
+        """
+        Appends the dbrefs imported since the last checkpoint to the log, and a note that the
+        running phase is done if finished.
+        """
+        lines = list()
+        if self.unsaved:
+            lines.append(json.dumps({"phase": self.running, "complete": self.unsaved}))
+            self.unsaved = list()
+        if finished:
+            lines.append(json.dumps({"phase": self.running, "finished": True}))
+        if not lines:
+            return
+        with open(self.checkpoint_path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def report(self, text):
+        self.connection.msg(text=f"@import {text}")
+
+    async def run_phase(self, name: str, objects, func):
+        """
+        Calls func(dbobj) for every object not already complete, in batches. Between batches it
+        saves a checkpoint and yields to the event loop so everyone else keeps getting served.
+
+        Args:
+            name (str): name of the phase, for progress reports.
+            objects (iterable of DbObject): what to import.
+            func (callable): imports one DbObject, returning the new object or None if it was
+                passed over.
+
+        Returns:
+            PhaseStats
+        """
+        objects = list(objects)
+        stats = PhaseStats(name, len(objects))
+        self.stats[name] = stats
+        last_report = time.monotonic()
+        for i in range(0, len(objects), self.batch_size):
+            for dbobj in objects[i:i+self.batch_size]:
+                if dbobj.id in self.complete:
+                    stats.resumed += 1
+                    continue
+                if func(dbobj) is not None:
+                    self.complete.add(dbobj.id)
+                    self.unsaved.append(dbobj.id)
+                    stats.done += 1
+            self.save_checkpoint()
+            if time.monotonic() - last_report >= self.report_interval:
+                self.report(str(stats))
+                last_report = time.monotonic()
+            await asyncio.sleep(0)
+        stats.finished = time.monotonic()
+        self.report(str(stats))
+        return stats
+
+    def start(self, name: str, coro):
+        """
+        Runs one of the import_* coroutines as a task on the event loop.
+
+        Returns:
+            False if an import is already running.
+        """
+        if self.task and not self.task.done():
+            coro.close()
+            return False
+        self.task = asyncio.ensure_future(self.finish(name, coro))
+        return True
+
+    async def finish(self, name: str, coro):
+        self.running = name
+        try:
+            await coro
+        except Exception as e:
+            # Whatever was imported before the failure is checkpointed, so a resume doesn't create
+            # it a second time.
+            self.save_checkpoint()
+            self.report(f"{name} failed: {e}. Run it again to resume from the last checkpoint.")
+            traceback.print_exc(file=sys.stdout)
+            return
+        self.phases.add(name)
+        self.save_checkpoint(finished=True)
+        self.report(f"{name} complete!")
 
     def create_obj(self, dbobj, mode, namespace=None):
         obj, error = self.core.mapped_typeclasses[mode].create(name=dbobj.name, objid=dbobj.objid, namespace=namespace)
@@ -63,6 +255,10 @@ class Importer:
 
     def get_or_create_obj(self, dbobj, mode, namespace=None):
         if not (obj := self.obj_map.get(dbobj.id, None)):
+            if (obj := self.core.objects.get(dbobj.objid, None)):
+                # Imported after the last checkpoint by a run that was cut off.
+                self.obj_map[dbobj.id] = obj
+                return obj
             obj = self.create_obj(dbobj, mode, namespace=namespace)
             obj.attributes.set('core', 'datetime_created', dbobj.created)
             obj.attributes.set('core', 'datetime_modified', dbobj.modified)
@@ -76,102 +272,80 @@ class Importer:
                     obj.attributes.set('mush', k, {"owner": owner.objid if owner else None, "flags": list(flags), 'value': v.value.encoded()})
         return obj
 
-    def import_grid(self):
-        districts = dict()
-        dis_data = self.db.list_districts()
-        for k, v in dis_data.items():
-            obj = self.get_or_create_obj(v, 'district')
-            obj.add_tag('penn_district')
-            districts[k] = obj
-        for k, v in districts.items():
-            dbobj = dis_data[k]
-            if (parent := self.obj_map.get(dbobj.parent, None)):
-                parent.districts.add(v)
-            if (ic := dbobj.get('D`IC', inherit=False)) and ic.value.truthy():
-                v.attributes.set('core', 'ic', True)
-
-        room_data = self.db.list_rooms()
-        room_total = dict()
-        room_districts = dict()
-        nodist_room = dict()
-        for k, v in room_data.items():
-            obj = self.get_or_create_obj(v, 'room')
-            if (district := districts.get(v.parent, None)):
-                district.rooms.add(obj)
-                room_districts[k] = obj
-            else:
-                nodist_room[k] = obj
-            room_total[k] = v
-            obj.add_tag('penn_room')
-
-        exit_data = self.db.list_exits()
-        exit_total = dict()
-        exit_dist = dict()
-        exit_nodist = dict()
-        for k, v in exit_data.items():
-            if not (location := self.obj_map.get(v.exits, None)):
-                continue  # No reason to make an Exit for a room that doesn't exist, is there?
-            if not (destination := self.obj_map.get(v.location, None)):
-                continue  # No reason to make an Exit for a room that doesn't exist, is there?
-            obj = self.get_or_create_obj(v, 'exit')
-            location.exits.add(obj)
-            destination.entrances.add(obj)
-            if (dist := location.relations.get('room_district')):
-                dist.exits.add(obj)
-                exit_dist[k] = obj
-            else:
-                exit_nodist[k] = obj
-
-            obj.add_tag('penn_exit')
-            exit_total[k] = obj
-        return {
-            'districts': districts.values(),
-            'room_total': room_total.values(),
-            'room_nodist': nodist_room.values(),
-            'room_dist': room_districts.values(),
-            'exit_total': exit_total.values(),
-            'exit_dist': exit_dist.values(),
-            'exit_nodist': exit_nodist.values()
-        }
-
-    def import_accounts(self):
-        namespace = self.core.namespace_prefix['A']
-        data = self.db.list_accounts()
-        total = list()
-        for k, v in data.items():
-            obj = self.get_or_create_obj(v, 'account', namespace=namespace)
-            obj.add_tag('penn_account')
-            total.append(obj)
-        return total
-
-    def import_characters(self):
-        namespace = self.core.namespace_prefix['C']
-        data = self.db.list_players()
-        total = list()
-        for k, v in data.items():
-            if 'Guest' in v.powers:
-                # Filtering out guests.
-                continue
-            obj = self.get_or_create_obj(v, 'mobile', namespace=namespace)
-            obj.attributes.set("core", "penn_hash", v.get('XYXXY').value.clean)
-            if (account := self.obj_map.get(v.parent, None)):
-                # Hooray, we have an account!
-                account.characters.add(obj)
-
-                if 'WIZARD' in v.flags:
-                    if not account.attributes.has('core', 'supervisor_level'):
-                        account.attributes.set('core', 'supervisor_level', 10)
-                elif 'ROYALTY' in v.flags:
+    def import_district(self, dbobj):
+        obj = self.get_or_create_obj(dbobj, 'district')
+        obj.add_tag('penn_district')
+        return obj
+
+    def link_district(self, dbobj):
+        if not (obj := self.obj_map.get(dbobj.id, None)):
+            return
+        if (parent := self.obj_map.get(dbobj.parent, None)):
+            parent.districts.add(obj)
+        if (ic := dbobj.get('D`IC', inherit=False)) and ic.value.truthy():
+            obj.attributes.set('core', 'ic', True)
+
+    def import_room(self, dbobj):
+        obj = self.get_or_create_obj(dbobj, 'room')
+        if dbobj.parent in self.districts and (district := self.obj_map.get(dbobj.parent, None)):
+            district.rooms.add(obj)
+        obj.add_tag('penn_room')
+        return obj
+
+    def import_exit(self, dbobj):
+        if not (location := self.obj_map.get(dbobj.exits, None)):
+            return None  # No reason to make an Exit for a room that doesn't exist, is there?
+        if not (destination := self.obj_map.get(dbobj.location, None)):
+            return None  # No reason to make an Exit for a room that doesn't exist, is there?
+        obj = self.get_or_create_obj(dbobj, 'exit')
+        location.exits.add(obj)
+        destination.entrances.add(obj)
+        if (dist := location.relations.get('room_district')):
+            dist.exits.add(obj)
+        obj.add_tag('penn_exit')
+        return obj
+
+    async def import_grid(self):
+        self.districts = self.db.list_districts()
+        await self.run_phase('districts', self.districts.values(), self.import_district)
+        # Linking is idempotent and there are few districts, so it is simply redone on a resume.
+        for dbobj in self.districts.values():
+            self.link_district(dbobj)
+        await self.run_phase('rooms', self.db.list_rooms().values(), self.import_room)
+        await self.run_phase('exits', self.db.list_exits().values(), self.import_exit)
+
+    def import_account(self, dbobj):
+        obj = self.get_or_create_obj(dbobj, 'account', namespace=self.core.namespace_prefix['A'])
+        obj.add_tag('penn_account')
+        return obj
+
+    def import_character(self, dbobj):
+        if 'Guest' in dbobj.powers:
+            # Filtering out guests.
+            return None
+        obj = self.get_or_create_obj(dbobj, 'mobile', namespace=self.core.namespace_prefix['C'])
+        obj.attributes.set("core", "penn_hash", dbobj.get('XYXXY').value.clean)
+        if (account := self.obj_map.get(dbobj.parent, None)):
+            # Hooray, we have an account!
+            account.characters.add(obj)
+
+            if 'WIZARD' in dbobj.flags:
+                if not account.attributes.has('core', 'supervisor_level'):
+                    account.attributes.set('core', 'supervisor_level', 10)
+            elif 'ROYALTY' in dbobj.flags:
+                if not account.attributes.has('core', 'supervisor_level'):
+                    account.attributes.set('core', 'supervisor_level', 8)
+            elif (va := obj.attributes.get('mush', 'V`ADMIN')):
+                if va == '1':
                     if not account.attributes.has('core', 'supervisor_level'):
-                        account.attributes.set('core', 'supervisor_level', 8)
-                elif (va := obj.attributes.get('mush', 'V`ADMIN')):
-                    if va == '1':
-                        if not account.attributes.has('core', 'supervisor_level'):
-                            account.attributes.set('core', 'supervisor_level', 6)
-
-                # if we don't get an account, then this character can still be accessed using their password, but...
-            if (location := self.obj_map.get(v.location, None)):
-                obj.attributes.set('core', 'logout_location', location.objid)
-            obj.add_tag('penn_character')
-            total.append(obj)
-        return total
+                        account.attributes.set('core', 'supervisor_level', 6)
+
+            # if we don't get an account, then this character can still be accessed using their password, but...
+        if (location := self.obj_map.get(dbobj.location, None)):
+            obj.attributes.set('core', 'logout_location', location.objid)
+        obj.add_tag('penn_character')
+        return obj
+
+    async def import_accounts(self):
+        await self.run_phase('accounts', self.db.list_accounts().values(), self.import_account)
+        await self.run_phase('characters', self.db.list_players().values(), self.import_character)
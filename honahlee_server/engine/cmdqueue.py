@@ -1,15 +1,82 @@
 import asyncio
+import heapq
+import re
 import sys
-from collections import OrderedDict
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from .commands.base import CommandException
+from .parser import Parser
+from .worker import ObjectSnapshot, CoreSnapshot, evaluate_offloaded
 import traceback
-from typing import Optional, Union, List, Set
+from typing import Optional, Union, List, Set, Tuple
+
+re_action_special = re.compile(r"[\\{}\[\];]")
+
+
+def _unbrace(action: str) -> str:
+    """
+    Removes one pair of braces if they enclose the whole action.
+    """
+    if len(action) < 2 or action[0] != '{' or action[-1] != '}':
+        return action
+    depth = 0
+    i = 0
+    while i < len(action):
+        c = action[i]
+        if c == '\\':
+            i += 1
+        elif c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if not depth:
+                return action[1:-1].strip() if i == len(action) - 1 else action
+        i += 1
+    return action
+
+
+@lru_cache(maxsize=1024)
+def split_actions(text: str) -> Tuple[str, ...]:
+    """
+    Splits an action list on the semicolons that aren't escaped or inside braces or brackets.
+    Actions are otherwise left as written, for their commands to evaluate. The result is cached,
+    as $-commands and @dolist run the same action lists over and over again.
+    """
+    actions = list()
+    start = 0
+    pos = 0
+    curly = 0
+    square = 0
+    while (match := re_action_special.search(text, pos)):
+        i = match.start()
+        c = text[i]
+        pos = i + 1
+        if c == '\\':
+            pos += 1
+        elif c == '{':
+            curly += 1
+        elif c == '}':
+            if curly:
+                curly -= 1
+        elif c == '[':
+            square += 1
+        elif c == ']':
+            if square:
+                square -= 1
+        elif not (curly or square):
+            actions.append(text[start:i])
+            start = pos
+    actions.append(text[start:])
+    return tuple(action for a in actions if (action := _unbrace(a.strip())))
 
 
 class QueueEntry:
 
     def __init__(self, enactor: int, actions: str, executor: Optional[int] = None, caller: Optional[int] = None,
-                 connection=None, spoof: Optional[int] = None, split=True):
+                 connection=None, spoof: Optional[int] = None, split=True, offload=False):
         self.source = enactor
         self.enactor = enactor
         self.executor = executor if executor else enactor
@@ -26,11 +93,26 @@ class QueueEntry:
         self.cmd = None
         self.core = None
         self.split_actions = split
+        # Timings, filled in as the entry moves through CmdQueue. All in seconds.
+        self.queue = None
+        self.queued_at = None
+        self.wait_time = None
+        self.wall_time = None
+        self.cpu_time = None
+        # (command class name, seconds) for each action run.
+        self.command_times = list()
+        # Offloaded entries are pure computation: their actions are evaluated as softcode in a
+        # worker process and only their output comes back. The actions must be bare expressions
+        # or think, as no other commands can run there. See engine/worker.py.
+        self.offload = offload
+        # Who this entry counts against for CmdQueue.queue_quota, fixed when it's queued.
+        self.quota_owner = None
 
     def process_action(self, enactor, text):
         try:
             cmd = enactor.find_cmd(text)
             if cmd:
+                started = time.perf_counter()
                 cmd.core = self.core
                 self.cmd = cmd
                 cmd.entry = self
@@ -45,6 +127,7 @@ class QueueEntry:
                     cmd.msg(text=f"EXCEPTION: {str(e)}")
                     traceback.print_exc(file=sys.stdout)
                 self.cmd = None
+                self.command_times.append((cmd.__class__.__name__, time.perf_counter() - started))
             else:
                 enactor.msg('Huh?  (Type "help" for help.)')
         except Exception as e:
@@ -53,13 +136,8 @@ class QueueEntry:
 
     def action_splitter(self, text, split=True):
         if not split:
-            yield text
-        else:
-            remaining = text
-            while len(remaining):
-                result, remaining, stopped = self.parser.evaluate(remaining, noeval=True, stop_at=[';'])
-                if result:
-                    yield result
+            return (text,)
+        return split_actions(text)
 
     def execute(self):
         if not (enactor := self.core.objects.get(self.enactor, None)):
@@ -67,55 +145,542 @@ class QueueEntry:
         if not len(self.actions):
             return 0
         self.parser = enactor.parser()
-        for action in self.action_splitter(self.actions, self.split_actions):
-            self.process_action(enactor, action)
+        started = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.parser.cpu_start = self.cpu_start
+        try:
+            for action in self.action_splitter(self.actions, self.split_actions):
+                self.process_action(enactor, action)
+                if self.parser.aborted:
+                    # A limit was hit. The rest of this entry's actions are dropped.
+                    break
+        finally:
+            self.wall_time = time.perf_counter() - started
+            self.cpu_time = time.process_time() - self.cpu_start
+
+
+class LatencyHistogram:
+    """
+    Counts durations into fixed buckets, bounded in milliseconds.
+    """
+    __slots__ = ("counts", "count", "total", "max")
+    bounds = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+    labels = tuple(f"<={b}ms" for b in bounds) + (f">{bounds[-1]}ms",)
+
+    def __init__(self):
+        # One count per bound plus one for anything slower than the last.
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bisect_left(self.bounds, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": (self.total / self.count * 1000) if self.count else 0.0,
+            "max_ms": self.max * 1000,
+            "buckets": {label: c for label, c in zip(self.labels, self.counts) if c},
+        }
 
 
 class WaitAction:
-    def __init__(self, queue, pid, entry, duration):
-        self.queue = queue
+    """
+    An entry waiting on a timer, a semaphore or both. Cancelled waits stay where they are in the
+    heap and semaphore queues and are skipped when they come up, or compacted away.
+    """
+    __slots__ = ("pid", "entry", "due", "semaphore", "cancelled")
+
+    def __init__(self, pid, entry, due=None, semaphore=None):
         self.pid = pid
         self.entry = entry
-        self.duration = duration
-
-    def start(self):
-        pass
-
-    async def run(self):
-        await asyncio.sleep(0.1)
-        self.queue.execute(self.entry)
-        self.queue.wait_queue.pop(self.pid)
+        # time.monotonic() when the wait runs out, or None to wait only on the semaphore.
+        self.due = due
+        # (object, attribute) for @wait obj/attr, or None.
+        self.semaphore = semaphore
+        self.cancelled = False
 
 
 class CmdQueue:
+    # Entries an enactor may run before the next enactor gets a turn.
+    tick_quota = 10
+    # Entries one owner may have queued at once, like PennMUSH's QUEUE_QUOTA.
+    queue_quota = 500
+    # Seconds the drain loop may spend on a batch before yielding to the event loop.
+    time_slice = 0.02
+    # How many recent batches to keep timings for.
+    batch_history = 1000
+    # How many recently finished entries @ps/stats lists.
+    recent_history = 50
+    # Worker processes for entries flagged offload. With 0 they run on the event loop like
+    # everything else.
+    workers = 0
+
     def __init__(self, core):
         self.core = core
-        self.queue_data = OrderedDict()
-        self.async_queue = asyncio.Queue()
+        # pid -> QueueEntry for everything ready to run.
+        self.queue_data = dict()
+        # Commands typed by players run before anything else. Everything else waits in a deque
+        # per enactor, and the enactors take turns in this OrderedDict's order.
+        self.priority = deque()
+        self.queues = OrderedDict()
+        self.turn_count = 0
+        self.owner_counts = Counter()
+        self.quota_rejections = Counter()
+        self.ready = asyncio.Event()
+        # (entries run, seconds taken) for recent batches.
+        self.batches = deque(maxlen=self.batch_history)
+        self.worker_pool = None
+        # pid -> QueueEntry for entries running in a worker.
+        self.offloaded = dict()
+        self.wait_latency = LatencyHistogram()
+        self.wall_latency = LatencyHistogram()
+        self.cpu_latency = LatencyHistogram()
+        self.command_latency = defaultdict(LatencyHistogram)
+        self.recent = deque(maxlen=self.recent_history)
+        # pid -> WaitAction for everything waiting.
         self.wait_queue = dict()
+        # (due, pid) min-heap of timed waits, and the event that wakes the wait scheduler early
+        # when something new becomes the soonest.
+        self.wait_heap = list()
+        self.wait_wakeup = asyncio.Event()
+        # (object, attribute) -> deque of pids blocked on that semaphore, and its count. A
+        # negative count is that many @notifies that nothing was waiting for yet.
+        self.semaphores = dict()
+        self.semaphore_counts = dict()
+        self.wait_task = None
         self.pid = 0
 
-    def push(self, entry):
-        self.pid += 1
-        self.queue_data[self.pid] = entry
-        self.async_queue.put_nowait(self.pid)
+    def owner_of(self, entry):
+        """
+        Who an entry counts against for queue_quota: the owner of its executor, so a runaway
+        @trigger chain spread over many objects is still charged to the one player behind it. A
+        character is charged to its account. Executors with neither, or that no longer exist,
+        are charged to themselves.
+        """
+        if self.core and (obj := self.core.objects.get(entry.executor, None)):
+            if (owner := obj.relations.get('owner', None) or obj.relations.get('account', None)):
+                return owner.objid
+        return entry.executor
 
-    def wait(self, entry, duration):
+    def charge(self, entry):
+        """
+        Counts entry against its owner's queue_quota, from when it's accepted, whether to run or
+        to wait, until it's taken to run or cancelled.
+
+        Returns:
+            False if its owner is over queue_quota and it should be dropped.
+        """
+        owner = entry.quota_owner = self.owner_of(entry)
+        if entry.connection is None and self.owner_counts[owner] >= self.queue_quota:
+            self.quota_rejections[owner] += 1
+            if self.core and (obj := self.core.objects.get(entry.enactor, None)):
+                obj.msg("Queue quota exceeded. Command discarded.")
+            return False
+        self.owner_counts[owner] += 1
+        return True
+
+    def uncharge(self, entry):
+        """
+        Frees the quota charge() took for entry.
+        """
+        if (count := self.owner_counts[owner := entry.quota_owner] - 1) > 0:
+            self.owner_counts[owner] = count
+        else:
+            del self.owner_counts[owner]
+
+    def push(self, entry, pid=None, charged=False):
+        """
+        Queues an entry to run.
+
+        Args:
+            entry (QueueEntry): what to run.
+            pid (int): the pid to run it as, or None for a new one.
+            charged (bool): True if entry was already charged to its owner's quota, such as
+                when it was accepted by wait().
+
+        Returns:
+            pid (int), or None if its owner is over queue_quota and it was dropped.
+        """
+        if not charged and not self.charge(entry):
+            return None
+        if pid is None:
+            self.pid += 1
+            pid = self.pid
+        entry.pid = pid
+        entry.queued_at = time.perf_counter()
+        self.queue_data[pid] = entry
+        if entry.connection is not None:
+            self.priority.append(pid)
+        elif (pids := self.queues.get(entry.enactor, None)) is not None:
+            pids.append(pid)
+        else:
+            self.queues[entry.enactor] = deque((pid,))
+        self.ready.set()
+        return pid
+
+    def next_pid(self):
+        """
+        Picks what runs next: any player command first, then the enactor whose turn it is, until
+        it has used tick_quota entries or has none left.
+        """
+        if self.priority:
+            return self.priority.popleft()
+        if not self.queues:
+            return None
+        enactor, pids = next(iter(self.queues.items()))
+        pid = pids.popleft()
+        self.turn_count += 1
+        if not pids:
+            del self.queues[enactor]
+            self.turn_count = 0
+        elif self.turn_count >= self.tick_quota:
+            self.queues.move_to_end(enactor)
+            self.turn_count = 0
+        return pid
+
+    def take(self, pid):
+        """
+        Removes a queued entry, freeing its owner's quota.
+        """
+        if (entry := self.queue_data.pop(pid, None)):
+            self.uncharge(entry)
+        return entry
+
+    def halt(self, enactor):
+        """
+        Drops everything enactor has queued, such as for a runaway @trigger loop.
+
+        Returns:
+            How many entries were dropped.
+        """
+        if self.queues and next(iter(self.queues)) == enactor:
+            # It was enactor's turn, so the next enactor's starts fresh.
+            self.turn_count = 0
+        pids = self.queues.pop(enactor, ())
+        for pid in pids:
+            self.take(pid)
+        return len(pids)
+
+    def wait(self, entry, duration=None, semaphore=None):
+        """
+        Queues entry after duration seconds, when semaphore is notified, or whichever comes first
+        if both are given.
+
+        Args:
+            entry (QueueEntry): what to run.
+            duration (float): seconds to wait, or None.
+            semaphore (tuple): (object, attribute) to wait on, or None.
+
+        Waiting entries count against their owner's queue_quota just as queued ones do.
+
+        Returns:
+            pid (int), as from push() if there turned out to be nothing to wait for, or None if
+                its owner is over queue_quota and it was dropped.
+        """
+        if duration is None and not semaphore:
+            return self.push(entry)
+        if not self.charge(entry):
+            return None
         self.pid += 1
-        w = WaitAction(self, self.pid, entry, duration)
-        self.wait_queue[self.pid] = w
-        w.start()
+        pid = self.pid
+        if semaphore:
+            count = self.semaphore_counts.get(semaphore, 0)
+            if count < 0:
+                # Already notified, so there's nothing to wait for.
+                if count + 1:
+                    self.semaphore_counts[semaphore] = count + 1
+                else:
+                    del self.semaphore_counts[semaphore]
+                return self.push(entry, pid, charged=True)
+            self.semaphore_counts[semaphore] = count + 1
+        due = time.monotonic() + duration if duration is not None else None
+        w = WaitAction(pid, entry, due, semaphore)
+        entry.pid = pid
+        entry.semaphore_obj = semaphore
+        self.wait_queue[pid] = w
+        if semaphore:
+            if not (waiting := self.semaphores.get(semaphore, None)):
+                waiting = self.semaphores[semaphore] = deque()
+            waiting.append(pid)
+        if due is not None:
+            heapq.heappush(self.wait_heap, (due, pid))
+            if self.wait_heap[0][1] == pid:
+                self.wait_wakeup.set()
+        return pid
 
-    async def execute(self, entry, pid):
+    def release(self, w):
+        """
+        Takes a wait out of the waiting set and queues its entry.
+        """
+        del self.wait_queue[w.pid]
+        w.cancelled = True
+        if w.semaphore:
+            self.unblock(w.semaphore)
+        self.push(w.entry, w.pid, charged=True)
+
+    def unblock(self, semaphore):
+        """
+        Counts one fewer wait on semaphore, after one has been released or cancelled. Its pid
+        may still be in the semaphore's deque, so the deque is compacted once mostly stale, and
+        both are dropped once nothing is waiting.
+        """
+        if (count := self.semaphore_counts[semaphore] - 1):
+            self.semaphore_counts[semaphore] = count
+        else:
+            del self.semaphore_counts[semaphore]
+        if (waiting := self.semaphores.get(semaphore, None)) is None:
+            return
+        if count <= 0:
+            del self.semaphores[semaphore]
+        elif len(waiting) > 2 * count:
+            # Compacted in place, as notify() may be iterating over it.
+            live = [pid for pid in waiting if pid in self.wait_queue]
+            waiting.clear()
+            waiting.extend(live)
+
+    def cancel(self, pid):
+        """
+        Drops a wait by pid.
+
+        Returns:
+            The cancelled QueueEntry, or None if nothing by that pid was waiting.
+        """
+        if not (w := self.wait_queue.pop(pid, None)):
+            return None
+        w.cancelled = True
+        if w.semaphore:
+            self.unblock(w.semaphore)
+        self.uncharge(w.entry)
+        return w.entry
+
+    def notify(self, semaphore, count=1):
+        """
+        Releases up to count entries waiting on semaphore, in the order they started waiting.
+        Notifications nobody was waiting for are banked for the next waits.
+
+        Returns:
+            How many entries were released.
+        """
+        released = 0
+        waiting = self.semaphores.get(semaphore, None)
+        while waiting and released < count:
+            if (w := self.wait_queue.get(waiting.popleft(), None)) and not w.cancelled:
+                self.release(w)
+                released += 1
+        if waiting is not None and not waiting:
+            self.semaphores.pop(semaphore, None)
+        if (banked := count - released):
+            if (remaining := self.semaphore_counts.get(semaphore, 0) - banked):
+                self.semaphore_counts[semaphore] = remaining
+            else:
+                self.semaphore_counts.pop(semaphore, None)
+        return released
+
+    def drain(self, semaphore):
+        """
+        Cancels everything waiting on semaphore and resets its count.
+
+        Returns:
+            How many entries were cancelled.
+        """
+        cancelled = 0
+        for pid in self.semaphores.pop(semaphore, ()):
+            if self.cancel(pid):
+                cancelled += 1
+        self.semaphore_counts.pop(semaphore, None)
+        return cancelled
+
+    def expire_waits(self):
+        """
+        Queues every timed wait that has run out.
+
+        Returns:
+            Seconds until the next one does, or None if there are none.
+        """
+        heap = self.wait_heap
+        now = time.monotonic()
+        while heap:
+            due, pid = heap[0]
+            if due > now:
+                return due - now
+            heapq.heappop(heap)
+            if (w := self.wait_queue.get(pid, None)) and not w.cancelled:
+                self.release(w)
+        return None
+
+    async def run_waits(self):
+        """
+        The one task that drives every timed wait.
+        """
+        while True:
+            try:
+                self.wait_wakeup.clear()
+                if (delay := self.expire_waits()) is None:
+                    await self.wait_wakeup.wait()
+                else:
+                    try:
+                        await asyncio.wait_for(self.wait_wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except Exception as e:
+                print(f"Oops, CmdQueue wait scheduler encountered Exception: {str(e)}")
+
+    def execute(self, entry, pid):
+        entry.pid = pid
+        entry.core = self.core
+        entry.queue = self
+        if entry.queued_at is not None:
+            entry.wait_time = time.perf_counter() - entry.queued_at
+        try:
+            entry.execute()
+        finally:
+            self.record(entry)
+
+    def record(self, entry):
+        if entry.wait_time is not None:
+            self.wait_latency.add(entry.wait_time)
+        if entry.wall_time is None:
+            return
+        self.wall_latency.add(entry.wall_time)
+        self.cpu_latency.add(entry.cpu_time)
+        for name, seconds in entry.command_times:
+            self.command_latency[name].add(seconds)
+        self.recent.append({
+            "pid": entry.pid,
+            "enactor": entry.enactor,
+            "actions": entry.actions[:80],
+            "wait_ms": (entry.wait_time or 0.0) * 1000,
+            "wall_ms": entry.wall_time * 1000,
+            "cpu_ms": entry.cpu_time * 1000,
+        })
+
+    def stats(self):
+        """
+        Everything the queue knows about its own performance, as plain data for @ps/stats and
+        the queue_stats RPC.
+        """
+        return {
+            "queued": len(self.queue_data),
+            "waiting": len(self.wait_queue),
+            "offloaded": len(self.offloaded),
+            "enactors": len(self.queues),
+            "batches": self.batch_stats(),
+            "wait": self.wait_latency.summary(),
+            "wall": self.wall_latency.summary(),
+            "cpu": self.cpu_latency.summary(),
+            "commands": {k: v.summary() for k, v in sorted(self.command_latency.items())},
+            "limit_hits": dict(Parser.limit_hits),
+            "function_cache": {"hits": Parser.function_cache.hits, "misses": Parser.function_cache.misses,
+                               "bytes": Parser.function_cache.bytes},
+            "quota_rejections": sum(self.quota_rejections.values()),
+            "recent": list(self.recent),
+        }
+
+    def start_workers(self):
+        if self.workers and not self.worker_pool:
+            self.worker_pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def offload(self, entry, pid):
+        """
+        Sends an entry to the worker pool along with snapshots of what it can see.
+        """
         entry.pid = pid
         entry.core = self.core
-        entry.execute()
+        entry.queue = self
+        if entry.queued_at is not None:
+            entry.wait_time = time.perf_counter() - entry.queued_at
+        if not (enactor := self.core.objects.get(entry.enactor, None)):
+            return
+        snapshot = ObjectSnapshot.from_obj(enactor)
+        core = CoreSnapshot(self.core.functions, {snapshot.objid: snapshot})
+        self.offloaded[pid] = entry
+        actions = entry.action_splitter(entry.actions, entry.split_actions)
+        future = asyncio.get_event_loop().run_in_executor(self.worker_pool, evaluate_offloaded, core,
+                                                          snapshot.objid, actions)
+        future.add_done_callback(partial(self.offload_done, pid))
+
+    def offload_done(self, pid, future):
+        entry = self.offloaded.pop(pid, None)
+        try:
+            intents, entry.wall_time, entry.cpu_time = future.result()
+        except Exception as e:
+            print(f"Oops, CmdQueue worker encountered Exception: {str(e)}")
+            return
+        finally:
+            self.record(entry)
+        self.apply_intents(intents)
+
+    def apply_intents(self, intents):
+        """
+        Carries out what a worker recorded, now that we're back on the event loop.
+        """
+        for kind, objid, text, kwargs in intents:
+            if kind == 'msg' and (obj := self.core.objects.get(objid, None)):
+                obj.msg(text=text, **kwargs)
+
+    def run_batch(self):
+        """
+        Runs queued entries until the queue is empty or time_slice has passed.
+
+        Returns:
+            How many entries ran.
+        """
+        start = time.perf_counter()
+        deadline = start + self.time_slice
+        count = 0
+        while (pid := self.next_pid()) is not None:
+            if (entry := self.take(pid)):
+                try:
+                    if entry.offload and self.worker_pool:
+                        self.offload(entry, pid)
+                    else:
+                        self.execute(entry, pid)
+                except Exception as e:
+                    print(f"Oops, CmdQueue encountered Exception: {str(e)}")
+                    traceback.print_exc(file=sys.stdout)
+                count += 1
+            if time.perf_counter() >= deadline:
+                break
+        if count:
+            self.batches.append((count, time.perf_counter() - start))
+        return count
+
+    def batch_stats(self):
+        """
+        Summarizes recent batches.
+
+        Returns:
+            dict
+        """
+        if not self.batches:
+            return {"batches": 0}
+        times = sorted(t for c, t in self.batches)
+        return {
+            "batches": len(times),
+            "entries": sum(c for c, t in self.batches),
+            "mean": sum(times) / len(times),
+            "p95": times[min(len(times) - 1, int(len(times) * 0.95))],
+            "max": times[-1],
+        }
 
     async def start(self):
+        self.start_workers()
+        if not self.wait_task:
+            self.wait_task = asyncio.ensure_future(self.run_waits())
         while True:
             try:
-                pid = await self.async_queue.get()
-                if (entry := self.queue_data.pop(pid, None)):
-                    await self.execute(entry, pid)
+                if not self.queue_data:
+                    self.ready.clear()
+                    await self.ready.wait()
+                self.run_batch()
+                # Let network I/O and everything else on the loop have a turn.
+                await asyncio.sleep(0)
             except Exception as e:
                 print(f"Oops, CmdQueue encountered Exception: {str(e)}")
@@ -220,6 +220,65 @@ class DumpCommand(MushCommand):
         self.enactor.msg(text="Dump complete!")
 
 
+class PsCommand(MushCommand):
+    """
+    Shows the command queue.
+
+    @ps - lists what is queued and waiting.
+    @ps/stats - timings for queue waits, entries and each kind of command.
+    """
+    name = '@ps'
+    aliases = ['@queue']
+    help_category = 'System'
+
+    @classmethod
+    def access(cls, enactor):
+        return enactor.get_slevel() >= 6
+
+    def execute(self):
+        if not (queue := self.entry.queue):
+            raise CommandException("No command queue to show.")
+        switches = (self.mdict.get('switches') or '').lower()
+        if 'stats' in switches or (self.args or '').strip().lower() == 'stats':
+            self.show_stats(queue)
+        else:
+            self.show_queue(queue)
+
+    def show_queue(self, queue):
+        out = fmt.FormatList(self.enactor)
+        out.add(fmt.Header("@ps: Queue"))
+        t1 = fmt.Table(('Pid', 7), ('Enactor', 12), ('State', 9), 'Actions')
+        for pid, entry in queue.queue_data.items():
+            t1.add_row(str(pid), str(entry.enactor), 'queued', entry.actions[:50])
+        for pid, w in queue.wait_queue.items():
+            t1.add_row(str(pid), str(w.entry.enactor), 'semaphore' if w.semaphore else 'wait', w.entry.actions[:50])
+        for pid, entry in queue.offloaded.items():
+            t1.add_row(str(pid), str(entry.enactor), 'worker', entry.actions[:50])
+        out.add(t1)
+        out.add(fmt.Footer())
+        self.enactor.send(out)
+
+    def show_stats(self, queue):
+        stats = queue.stats()
+        out = fmt.FormatList(self.enactor)
+        out.add(fmt.Header("@ps: Queue Stats"))
+        out.add(fmt.Text(f"Queued: {stats['queued']}  Waiting: {stats['waiting']}  In workers: {stats['offloaded']}  "
+                         f"Quota rejections: {stats['quota_rejections']}  Limit hits: {stats['limit_hits']}"))
+        t1 = fmt.Table('Timing', ('Count', 9), ('Mean ms', 9), ('Max ms', 9))
+        for label, key in (('Queue wait', 'wait'), ('Entry wall', 'wall'), ('Entry CPU', 'cpu')):
+            h = stats[key]
+            t1.add_row(label, str(h['count']), f"{h['mean_ms']:.2f}", f"{h['max_ms']:.2f}")
+        for name, h in stats['commands'].items():
+            t1.add_row(name, str(h['count']), f"{h['mean_ms']:.2f}", f"{h['max_ms']:.2f}")
+        out.add(t1)
+        t2 = fmt.Table(('Pid', 7), ('Wait ms', 9), ('Wall ms', 9), ('CPU ms', 9), 'Actions')
+        for r in reversed(stats['recent'][-10:]):
+            t2.add_row(str(r['pid']), f"{r['wait_ms']:.1f}", f"{r['wall_ms']:.1f}", f"{r['cpu_ms']:.1f}", r['actions'][:40])
+        out.add(t2)
+        out.add(fmt.Footer())
+        self.enactor.send(out)
+
+
 class NameCommand(MushCommand):
     name = '@name'
     aliases = ['@na', '@nam']
@@ -326,3 +385,4 @@ class AccountCommandMatcher(PythonCommandMatcher):
         self.add(DumpCommand)
         self.add(StyleCommand)
         self.add(WhoCommand)
+        self.add(PsCommand)
@@ -287,21 +287,18 @@ class ImportCommand(Command):
         op_map[op]()
 
     def op_grid(self):
-        if 'grid' in self.enactor.penn.complete:
-            raise CommandException("Those were already imported!")
-        out = self.enactor.penn.import_grid()
-        for k, v in out.items():
-            self.msg(f"Imported: {k} - {len(v)}")
-        self.enactor.penn.complete.add('grid')
+        self.start_phase('grid', self.enactor.penn.import_grid)
 
     def op_accounts(self):
-        if 'accounts' in self.enactor.penn.complete:
+        self.start_phase('accounts', self.enactor.penn.import_accounts)
+
+    def start_phase(self, name, func):
+        penn = self.enactor.penn
+        if name in penn.phases:
             raise CommandException("Those were already imported!")
-        out = self.enactor.penn.import_accounts()
-        self.msg(f"Imported {len(out)} Accounts!")
-        out = self.enactor.penn.import_characters()
-        self.msg(f"Imported {len(out)} Player Objects!")
-        self.enactor.penn.complete.add('accounts')
+        if not penn.start(name, func()):
+            raise CommandException("An import is already running!")
+        self.msg(f"Importing {name}. Progress will be reported as it goes.")
 
 
 class PyCommand(Command):
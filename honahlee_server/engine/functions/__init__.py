@@ -0,0 +1,10 @@
+"""
+Softcode functions. Parser looks them up in core.functions, which should be a FunctionTable built
+from ALL_FUNCTIONS and whatever else a game adds.
+"""
+from .base import FunctionTable
+from .control import CONTROL_FUNCTIONS
+from .lists import LIST_FUNCTIONS
+from .string import STRING_FUNCTIONS
+
+ALL_FUNCTIONS = STRING_FUNCTIONS + CONTROL_FUNCTIONS + LIST_FUNCTIONS
@@ -9,14 +9,20 @@ class BaseFunction:
     max_args = None
     even_args = False
     odd_args = False
+    # Functions with eval_args = False get their arguments unevaluated and call self.arg(i) for
+    # only the ones they need.
     eval_args = True
+    # Pure functions always give the same output for the same evaluated arguments and have no
+    # side effects, so their results can be reused from Parser.function_cache.
+    pure = False
 
-    def __init__(self, entry, called_as, remaining):
+    def __init__(self, entry, called_as, call):
         self.entry = entry
         self.called_as = called_as
+        # The compiled FunctionCall. call.args holds each argument's compiled softcode.
+        self.call = call
         self.output = ''
-        self.remaining = remaining
-        self.args = list()
+        self.args = call.sources
         self.args_eval = list()
         self.args_count = 0
         self.error = False
@@ -49,19 +55,31 @@ class BaseFunction:
             f"#-1 FUNCTION ({self.name.upper()}) EXPECTS ODD NUMBER OF ARGUMENTS BUT GOT {num}")
         self.error = True
 
-    def gather_arg(self, noeval=False):
-        data, self.remaining, stopped = self.entry.evaluate(self.remaining, stop_at=[')', ','], noeval=noeval)
-        return data, stopped
+    def gather_arg(self, index, noeval=False):
+        if noeval:
+            data, remaining, stopped = self.entry.evaluate(self.args[index], noeval=True)
+            return data
+        return self.entry.run(self.call.args[index])
 
     def gather_all_args(self, noeval=False):
-        stopped = ','
-        while stopped == ',':
-            data, stopped = self.gather_arg(noeval)
-            self.args_eval.append(data)
+        for i in range(len(self.args)):
+            self.args_eval.append(self.gather_arg(i, noeval))
+
+    def arg(self, index):
+        """
+        Evaluates an argument the first time it's asked for. Used by functions that don't
+        evaluate their arguments up front.
+        """
+        if (data := self.args_eval[index]) is None:
+            data = self.args_eval[index] = self.gather_arg(index)
+        return data
 
     def execute(self):
-        self.gather_all_args()
-        self.args_count = len(self.args_eval)
+        if self.eval_args:
+            self.gather_all_args()
+        else:
+            self.args_eval = [None] * len(self.args)
+        self.args_count = len(self.args)
         c = self.args_count
         if self.max_args is not None and c > self.max_args:
             self._err_too_many_args(c)
@@ -75,15 +93,80 @@ class BaseFunction:
         if self.odd_args and c % 2 == 0:
             self._err_even_args(c)
             return
+        if not (self.pure and self.eval_args):
+            self.do_execute()
+            return
+        cache = self.entry.function_cache
+        key = cache.key(self.__class__, self.args_eval)
+        if (output := cache.get(key)) is not None:
+            self.output = output
+            return
         self.do_execute()
+        if not self.error:
+            cache.put(key, self.output)
 
     def do_execute(self):
         self.output = f"#-1 FUNCTION {self.name.upper()} IS NOT IMPLEMENTED"
         self.error = True
 
 
+def truthy(text) -> bool:
+    """
+    PennMUSH boolean rules: empty text, 0 and errors or other negative dbrefs are false.
+    """
+    text = (text.plain if hasattr(text, 'plain') else str(text)).strip()
+    if not text or text.startswith('#-'):
+        return False
+    try:
+        return float(text) != 0
+    except ValueError:
+        return True
+
+
+def apply_bangs(bangs: str, output) -> str:
+    """
+    Applies the bangs a function was called with to its output, as PennMUSH does: ! gives 1 if
+    the output is false and 0 if not, and !! gives 1 if it is true. A trailing $ judges by string
+    truth, where any non-empty output is true, and a trailing ^ by number truth, where only
+    a nonzero number is.
+    """
+    text = (output.plain if hasattr(output, 'plain') else str(output)).strip()
+    if bangs.endswith('$'):
+        result = bool(text)
+    elif bangs.endswith('^'):
+        try:
+            result = float(text) != 0
+        except ValueError:
+            result = False
+    else:
+        result = truthy(text)
+    if not bangs.startswith('!!'):
+        result = not result
+    return '1' if result else '0'
+
+
 class NotFound(BaseFunction):
     def execute(self):
         self.gather_all_args(noeval=True)
         self.output = f"#-1 FUNCTION ({self.called_as.upper()}) NOT FOUND"
-        self.error = True
\ No newline at end of file
+        self.error = True
+
+
+class FunctionTable(dict):
+    """
+    Maps lowercase function names and aliases to BaseFunction classes. Parser lowercases a name
+    once when it compiles the call, so every lookup after that is a single dict hit. That means
+    core.functions must be keyed this way, aliases included, so it should be one of these, such
+    as FunctionTable(ALL_FUNCTIONS) from this package.
+    """
+
+    def __init__(self, functions=None):
+        super().__init__()
+        if functions:
+            for func in functions:
+                self.add(func)
+
+    def add(self, func):
+        self[func.name.lower()] = func
+        for alias in func.aliases:
+            self[alias.lower()] = func
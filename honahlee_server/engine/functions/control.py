@@ -0,0 +1,73 @@
+import re
+from functools import lru_cache
+from . base import BaseFunction, truthy
+
+
+@lru_cache(maxsize=1024)
+def wildcard(pattern: str):
+    """
+    Compiles a PennMUSH wildcard pattern, where * matches anything and ? one character.
+    """
+    return re.compile(re.escape(pattern).replace(r'\*', '.*').replace(r'\?', '.'), flags=re.IGNORECASE | re.DOTALL)
+
+
+class IfFunction(BaseFunction):
+    name = "if"
+    aliases = {"ifelse"}
+    min_args = 2
+    max_args = 3
+    eval_args = False
+
+    def do_execute(self):
+        if truthy(self.arg(0)):
+            self.output = self.arg(1)
+        elif self.args_count == 3:
+            self.output = self.arg(2)
+
+
+class SwitchFunction(BaseFunction):
+    name = "switch"
+    min_args = 3
+    eval_args = False
+
+    def do_execute(self):
+        text = self.arg(0).plain
+        last = self.args_count - 1
+        for i in range(1, last, 2):
+            if wildcard(self.arg(i).plain).fullmatch(text):
+                self.output = self.arg(i + 1)
+                return
+        if self.args_count % 2 == 0:
+            # An even count leaves a default at the end.
+            self.output = self.arg(last)
+
+
+class AndFunction(BaseFunction):
+    name = "and"
+    aliases = {"cand"}
+    min_args = 1
+    eval_args = False
+
+    def do_execute(self):
+        for i in range(self.args_count):
+            if not truthy(self.arg(i)):
+                self.output = "0"
+                return
+        self.output = "1"
+
+
+class OrFunction(BaseFunction):
+    name = "or"
+    aliases = {"cor"}
+    min_args = 1
+    eval_args = False
+
+    def do_execute(self):
+        for i in range(self.args_count):
+            if truthy(self.arg(i)):
+                self.output = "1"
+                return
+        self.output = "0"
+
+
+CONTROL_FUNCTIONS = [IfFunction, SwitchFunction, AndFunction, OrFunction]
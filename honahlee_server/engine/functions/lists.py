@@ -0,0 +1,244 @@
+import re
+from functools import lru_cache
+from typing import Tuple
+from . base import BaseFunction
+from ..softcode import compile_softcode
+
+re_dbref = re.compile(r"#-?\d+")
+
+
+@lru_cache(maxsize=1024)
+def split_list(text: str, delim: str = ' ') -> Tuple[str, ...]:
+    """
+    Splits a softcode list once into a tuple of elements. With the default space delimiter, runs
+    of spaces count as one and leading and trailing spaces are ignored.
+    """
+    if delim == ' ':
+        return tuple(text.split())
+    if not text:
+        return tuple()
+    return tuple(text.split(delim))
+
+
+def _number(text: str):
+    try:
+        return int(text)
+    except ValueError:
+        return 0
+
+
+def _float(text: str):
+    try:
+        return float(text)
+    except ValueError:
+        return 0.0
+
+
+def _dbref(text: str):
+    return int(text[1:]) if re_dbref.fullmatch(text) else -1
+
+
+SORT_KEYS = {
+    'a': None,
+    'i': str.lower,
+    'n': _number,
+    'f': _float,
+    'd': _dbref,
+}
+
+
+def autodetect(items) -> str:
+    """
+    Picks the sort type PennMUSH would for a list: dbrefs, integers, floats or else plain text.
+    """
+    if all(re_dbref.fullmatch(i) for i in items):
+        return 'd'
+    try:
+        for i in items:
+            int(i)
+        return 'n'
+    except ValueError:
+        pass
+    try:
+        for i in items:
+            float(i)
+        return 'f'
+    except ValueError:
+        return 'a'
+
+
+def sort_items(items, kind: str = ''):
+    if not items:
+        return list()
+    kind = kind[:1].lower() if kind else autodetect(items)
+    return sorted(items, key=SORT_KEYS.get(kind, None))
+
+
+class ListFunction(BaseFunction):
+    """
+    Base for functions that take a list. Arguments are read through self.arg(), so this works
+    for functions that evaluate their arguments eagerly or lazily.
+    """
+
+    def text_arg(self, index, default=''):
+        if index >= self.args_count:
+            return default
+        return self.arg(index).plain
+
+    def delim_arg(self, index):
+        return self.text_arg(index) or ' '
+
+    def list_arg(self, index, delim=' '):
+        return split_list(self.text_arg(index), delim)
+
+    def osep_arg(self, index, delim=' '):
+        """
+        The output separator defaults to the delimiter.
+        """
+        if index >= self.args_count:
+            return delim
+        return self.arg(index)
+
+    def join_list(self, items, osep):
+        out = list()
+        for i, item in enumerate(items):
+            if i:
+                out.append(osep)
+            out.append(item)
+        return self.entry.join(out)
+
+    def lambda_arg(self, index):
+        """
+        Compiles an evaluated #lambda/<code> argument, the only kind of attribute this supports.
+
+        Returns:
+            The compiled nodes, or None after setting an error.
+        """
+        code = self.text_arg(index)
+        if not code.lower().startswith('#lambda/'):
+            self.output = "#-1 ONLY #LAMBDA IS SUPPORTED"
+            self.error = True
+            return None
+        return compile_softcode(code[8:], nesting_limit=self.entry.function_recursion_limit).nodes
+
+
+class IterFunction(ListFunction):
+    name = "iter"
+    aliases = {"parse"}
+    min_args = 2
+    max_args = 4
+    eval_args = False
+
+    def do_execute(self):
+        delim = self.delim_arg(2)
+        items = self.list_arg(0, delim)
+        osep = self.osep_arg(3, delim)
+        # The pattern is compiled once, with ## and #@ as nodes, and run again for each element.
+        nodes = self.call.args[1]
+        entry = self.entry
+        stack = entry.iter_stack
+        out = list()
+        for position, item in enumerate(items, 1):
+            stack.append((item, position))
+            try:
+                out.append(entry.run(nodes))
+            finally:
+                stack.pop()
+            if entry.aborted:
+                break
+        self.output = self.join_list(out, osep)
+
+
+class MapFunction(ListFunction):
+    name = "map"
+    min_args = 2
+    max_args = 4
+
+    def do_execute(self):
+        if (nodes := self.lambda_arg(0)) is None:
+            return
+        delim = self.delim_arg(2)
+        entry = self.entry
+        out = list()
+        for position, item in enumerate(self.list_arg(1, delim), 1):
+            out.append(entry.run(nodes, number_args={0: item, 1: str(position)}))
+            if entry.aborted:
+                break
+        self.output = self.join_list(out, self.osep_arg(3, delim))
+
+
+class FilterFunction(ListFunction):
+    name = "filter"
+    min_args = 2
+    max_args = 4
+
+    def do_execute(self):
+        if (nodes := self.lambda_arg(0)) is None:
+            return
+        delim = self.delim_arg(2)
+        entry = self.entry
+        out = list()
+        for item in self.list_arg(1, delim):
+            if entry.run(nodes, number_args={0: item}).plain == '1':
+                out.append(item)
+            if entry.aborted:
+                break
+        self.output = self.join_list(out, self.osep_arg(3, delim))
+
+
+class SortFunction(ListFunction):
+    name = "sort"
+    min_args = 1
+    max_args = 4
+    pure = True
+
+    def do_execute(self):
+        delim = self.delim_arg(2)
+        items = sort_items(self.list_arg(0, delim), self.text_arg(1))
+        self.output = self.join_list(items, self.osep_arg(3, delim))
+
+
+class SetFunction(ListFunction):
+    """
+    setunion(), setinter() and setdiff() share the signature
+    (list1, list2[, delim[, sort type[, osep]]]) and a sorted, de-duplicated result.
+    """
+    min_args = 2
+    max_args = 5
+    pure = True
+
+    def combine(self, first, second):
+        raise NotImplementedError
+
+    def do_execute(self):
+        delim = self.delim_arg(2)
+        items = self.combine(self.list_arg(0, delim), self.list_arg(1, delim))
+        self.output = self.join_list(sort_items(items, self.text_arg(3)), self.osep_arg(4, delim))
+
+
+class SetUnionFunction(SetFunction):
+    name = "setunion"
+
+    def combine(self, first, second):
+        # dict keeps the first occurrence of each element without a nested scan.
+        return list(dict.fromkeys(first + second))
+
+
+class SetInterFunction(SetFunction):
+    name = "setinter"
+
+    def combine(self, first, second):
+        second = set(second)
+        return [i for i in dict.fromkeys(first) if i in second]
+
+
+class SetDiffFunction(SetFunction):
+    name = "setdiff"
+
+    def combine(self, first, second):
+        second = set(second)
+        return [i for i in dict.fromkeys(first) if i not in second]
+
+
+LIST_FUNCTIONS = [IterFunction, MapFunction, FilterFunction, SortFunction, SetUnionFunction, SetInterFunction,
+                  SetDiffFunction]
@@ -6,6 +6,7 @@ class AnsiFunction(BaseFunction):
     name = "ansi"
     min_args = 2
     max_args = 2
+    pure = True
 
     def do_execute(self):
         codes = self.args_eval[0].clean
@@ -1,10 +1,21 @@
-from .functions.base import NotFound as NotFoundFunction
+from .functions.base import NotFound as NotFoundFunction, apply_bangs
+from .softcode import compile_softcode
 from rich.text import Text
-import re
+from collections import ChainMap, Counter, OrderedDict
+import time
 
 
 class StackFrame:
+    __slots__ = ("parent", "entry", "enactor", "spoof", "executor", "caller", "dolist_val", "iter_val",
+                 "localized", "number_args", "vars")
+
     def __init__(self, entry, parent):
+        self.reset(entry, parent)
+
+    def reset(self, entry, parent):
+        """
+        Readies the frame for (re)use. Parser recycles frames rather than allocating new ones.
+        """
         self.parent = parent
         self.entry = entry
         self.enactor = None
@@ -14,23 +25,144 @@ class StackFrame:
         self.dolist_val = None
         self.iter_val = None
         self.localized = False
-        self.number_args = None
         if parent:
+            # %0-%9 and registers are visible all the way down, such as inside function arguments.
+            self.number_args = parent.number_args
             self.vars = parent.vars
         else:
+            self.number_args = None
             self.vars = entry.vars
 
+    def release(self):
+        # Don't keep anything alive while sitting in the free list.
+        self.parent = None
+        self.entry = None
+        self.vars = None
+        self.number_args = None
+        self.executor = None
+
     def localize(self):
         self.localized = True
-        # We are localizing this frame, so break the connection to its parent.
-        self.vars = dict(self.vars)
+        # We are localizing this frame, so break the connection to its parent. Writes land in a
+        # new front map and reads fall through to the parent's registers, so nothing is copied.
+        if isinstance(self.vars, ChainMap):
+            self.vars = self.vars.new_child()
+        else:
+            self.vars = ChainMap(dict(), self.vars)
+
+
+class FunctionCache:
+    """
+    A byte-bounded LRU of pure function results, keyed by function class and evaluated arguments.
+    """
+
+    # Rough per-entry cost of the key tuple, the OrderedDict slot and the output object.
+    overhead = 200
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(func, args):
+        return func, tuple((a.plain, tuple(a.spans)) if isinstance(a, Text) else a for a in args)
+
+    @classmethod
+    def size(cls, key, output):
+        size = cls.overhead + len(output.plain if isinstance(output, Text) else output)
+        for arg in key[1]:
+            size += len(arg[0] if isinstance(arg, tuple) else arg)
+        return size
+
+    def get(self, key):
+        if (found := self.entries.get(key, None)) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        output = found[0]
+        # Text is mutable, so callers get their own copy.
+        return output.copy() if isinstance(output, Text) else output
+
+    def put(self, key, output):
+        if not isinstance(output, (str, Text)):
+            return
+        size = self.size(key, output)
+        if size > self.max_bytes:
+            return
+        if (old := self.entries.pop(key, None)):
+            self.bytes -= old[1]
+        self.entries[key] = (output.copy() if isinstance(output, Text) else output, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            evicted = self.entries.popitem(last=False)[1]
+            self.bytes -= evicted[1]
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+
+def sub_enactor(parser, arg):
+    return str(parser.enactor)
+
+
+def sub_name(parser, arg):
+    return parser.enactor.name
+
+
+def sub_ansi(parser, arg):
+    return 'ansi'
+
+
+def sub_newline(parser, arg):
+    return '\n'
+
+
+def sub_tab(parser, arg):
+    return '\t'
+
+
+def sub_space(parser, arg):
+    return ' '
+
+
+def sub_location(parser, arg):
+    if (loc := parser.enactor.relations.get('location')):
+        return loc.objid
+    return ''
+
+
+def sub_number_arg(parser, arg):
+    if parser.frame and parser.frame.number_args:
+        return parser.frame.number_args.get(arg, '')
+    return ''
+
+
+def sub_register(parser, arg):
+    registers = parser.frame.vars if parser.frame else parser.vars
+    return registers.get(arg, '')
 
 
 class Parser:
-    re_func = re.compile(r"^(?P<bangs>!|!!|!\$|!!\$|!\^|!!\^)?(?P<func>\w+)(?P<open>\()")
-    re_number_args = re.compile(r"^%(?P<number>\d+)")
-    re_q_old = re.compile(r"(?i)^%q(?P<q>[A-Z0-9])")
-    re_q_named = re.compile(r"(?i)^%q<(?P<q>\w+)>")
+    # Per-QueueEntry budgets, as in PennMUSH's function_invocation_limit, function_recursion_limit
+    # and queue_entry_cpu_time.
+    function_invocation_limit = 25000
+    function_recursion_limit = 50
+    cpu_limit = 2.0
+    # How many times each limit has been hit, across all parsers.
+    limit_hits = Counter()
+    # Results of functions marked pure, shared by all parsers.
+    function_cache = FunctionCache()
+
+    # The character after a % maps to a func(parser, arg). Services may add their own with
+    # Parser.register_sub().
+    substitutions = dict()
 
     def __init__(self, core, enactor, executor, caller):
         self.core = core
@@ -39,49 +171,176 @@ class Parser:
         self.caller = caller
         self.stack = list()
         self.frame = None
+        # Popped StackFrames waiting to be reused.
+        self.free_frames = list()
         self.func_count = 0
+        self.func_depth = 0
+        # process_time() when the QueueEntry started. No CPU limit is enforced while it's None.
+        self.cpu_start = None
+        # The error that stopped evaluation, once a limit is hit.
+        self.aborted = None
+        # (element, position) for each iter() being evaluated, innermost last.
+        self.iter_stack = list()
         self.vars = dict()
 
-    def eval_sub(self, text: str):
-        """
-        Eventually this will process % and other substitutions.
-        """
-        if text.startswith('%#'):
-            return str(self.enactor), text[2:]
-        elif text.startswith('%n'):
-            return self.enactor.name, text[2:]
-        elif text.startswith('%a'):
-            return 'ansi', text[2:]
-        elif text.startswith('%R') or text.startswith('%r'):
-            return '\n', text[2:]
-        elif text.startswith('%T') or text.startswith('%t'):
-            return '\t', text[2:]
-        elif text.startswith('%l') or text.startswith('%L'):
-            if (loc := self.enactor.relations.get('location')):
-                return loc.objid, text[2:]
-            else:
-                return '', text[2:]
-        elif (m := self.re_number_args.fullmatch(text)):
-            mdict = m.groupdict()
-            num = int(mdict['number'])
-            if self.frame.number_args:
-                return self.frame.number_args.get(num, ''), text[len(mdict['number'])+1:]
+    def eval_sub(self, code: str, arg=None):
+        """
+        Runs one % substitution through the substitutions table.
+
+        Args:
+            code (str): the character that followed the %.
+            arg: what the compiler parsed after it, if anything.
+        """
+        if (sub := self.substitutions.get(code, None)):
+            return sub(self, arg)
+        return f"%{code}"
+
+    def iter_value(self, code: str):
+        """
+        Resolves ## and #@ against the innermost iter(). Outside of one they are left as written.
+        """
+        if not self.iter_stack:
+            return f"#{code}"
+        element, position = self.iter_stack[-1]
+        return element if code == '#' else str(position)
+
+    @classmethod
+    def register_sub(cls, code: str, func):
+        """
+        Adds or replaces a substitution. func(parser, arg) must return a str or Text.
+        """
+        cls.substitutions[code] = func
+
+    def find_function(self, key: str):
+        """
+        Looks up a function by its lowercase name in core.functions. That has to be keyed by
+        lowercase names and aliases, as a FunctionTable is. Names aren't lowercased here.
+        """
+        return self.core.functions.get(key, None)
+
+    def abort(self, reason: str, error: str):
+        """
+        Stops evaluation for the rest of the QueueEntry. Every function called from here on
+        returns error without running.
+        """
+        self.aborted = error
+        self.limit_hits[reason] += 1
+        return error
+
+    def check_limits(self):
+        """
+        Returns:
+            An error if calling one more function would exceed a limit, else None.
+        """
+        if self.aborted:
+            return self.aborted
+        if self.func_count >= self.function_invocation_limit:
+            return self.abort('invocation', "#-1 FUNCTION INVOCATION LIMIT EXCEEDED")
+        if self.func_depth >= self.function_recursion_limit:
+            return self.abort('recursion', "#-1 FUNCTION RECURSION LIMIT EXCEEDED")
+        if self.cpu_start is not None and time.process_time() - self.cpu_start > self.cpu_limit:
+            return self.abort('cpu', "#-1 CPU USAGE LIMIT EXCEEDED")
+        return None
+
+    def call_function(self, call):
+        """
+        Runs a compiled FunctionCall.
+
+        Returns:
+            The function's output, or None if there's no such function and the call should be
+            left as plain text.
+        """
+        if (func := self.find_function(call.key)):
+            ready_fun = func(self, call.name, call)
+        elif call.strict:
+            ready_fun = NotFoundFunction(self, call.name, call)
+        else:
+            return None
+        if (error := self.check_limits()):
+            return error
+        self.func_count += 1
+        self.func_depth += 1
+        try:
+            ready_fun.execute()
+        finally:
+            self.func_depth -= 1
+        output = ready_fun.output
+        if call.bangs:
+            return apply_bangs(call.bangs, output)
+        return output if isinstance(output, (str, Text)) else str(output)
+
+    def push_frame(self, localize: bool = False, executor=None, number_args=None):
+        if self.free_frames:
+            frame = self.free_frames.pop()
+            frame.reset(self, self.frame)
         else:
-            return '%', text[1:]
+            frame = StackFrame(self, self.frame)
+        self.frame = frame
+        if localize:
+            self.frame.localize()
+        if number_args:
+            self.frame.number_args = number_args
+        if executor:
+            self.frame.executor = executor
+        self.stack.append(self.frame)
+
+    def pop_frame(self):
+        frame = self.stack.pop(-1)
+        frame.release()
+        self.free_frames.append(frame)
+        self.frame = self.stack[-1] if self.stack else None
+
+    @staticmethod
+    def join(pieces):
+        """
+        Joins output spans into one Text. Runs of plain strings are joined before they are
+        appended so only Text spans with markup get copied piece by piece.
+        """
+        out = Text()
+        run = list()
+        for piece in pieces:
+            if isinstance(piece, str):
+                run.append(piece)
+            else:
+                if run:
+                    out.append(''.join(run))
+                    run.clear()
+                out.append(piece)
+        if run:
+            out.append(''.join(run))
+        return out
 
-    def find_function(self, funcname: str):
-        return self.core.functions.get(funcname.lower(), None)
+    def run(self, nodes, localize: bool = False, executor=None, number_args=None):
+        """
+        Evaluates compiled softcode in a new stack frame.
+
+        Returns:
+            Text
+        """
+        if self.aborted:
+            # Whatever is looping over this code should wind down as quickly as possible.
+            return Text()
+        self.push_frame(localize=localize, executor=executor, number_args=number_args)
+        out = list()
+        try:
+            for node in nodes:
+                node.evaluate(self, out)
+        finally:
+            self.pop_frame()
+        return self.join(out)
 
     def evaluate(self, text: str, localize: bool = False, spoof: str = None, called_recursively: bool = False, stop_at=None,
                  recurse=True, substitute=True, functions=True, curly_literals=True, noeval=False, executor=None, number_args=None):
+        """
+        Evaluates text up to the first character in stop_at.
+
+        Returns:
+            out (Text), remaining (str), stopped (str or None)
+        """
         if text is None:
             text = ''
         if isinstance(text, Text):
             text = text.plain
-        if stop_at is None:
-            stop_at = list()
-        if isinstance(stop_at, str):
-            stop_at = [stop_at]
         if not len(text):
             return Text(""), '', None
         if noeval:
@@ -89,100 +348,31 @@ class Parser:
             substitute = False
             functions = False
             curly_literals = True
-        # if cpu exceeded, cancel here.
-        # if fil exceeded, cancel here.
-        # if recursion limit reached, cancel here.
-        if not noeval:
-            if self.frame:
-                new_frame = StackFrame(self, self.frame)
-                self.frame = new_frame
-                if localize:
-                    new_frame.localize()
-                self.stack.append(new_frame)
-            else:
-                self.frame = StackFrame(self, None)
-                self.stack.append(self.frame)
-            if number_args:
-                self.frame.number_args = number_args
-            if executor:
-                self.frame.executor = executor
-        out = Text()
-        remaining = text
-        escaped = False
-        called_func = False
-        stopped = None
-        curl_escaped = False
-        nest_depth = 0
-
-        i = -1
-
-        while i < len(remaining)-1:
-            i += 1
-            c = remaining[i]
-            if escaped:
-                out += c
-                escaped = False
-            else:
-                if c == '\\':
-                    escaped = True
-                elif c == '{' and curly_literals and not curl_escaped:
-                    curl_escaped += 1
-                elif c == '}' and curly_literals and curl_escaped > 0:
-                    curl_escaped -= 1
-                elif stop_at and c in stop_at and nest_depth == 0:
-                    if curl_escaped:
-                        out += c
-                    else:
-                        remaining = remaining[i+1:]
-                        stopped = c
-                        break
-                elif c == '%' and substitute:
-                    subbed, remaining = self.eval_sub(remaining[i:])
-                    out += subbed
-                    i = -1
-                elif c == '[' and recurse:
-                    evaled, remaining, stop_char = self.evaluate(remaining[i+1:], called_recursively=True, stop_at=']')
-                    i = -1
-                    out += evaled
-                elif c == '(' and not called_func and functions:
-                    out += c
-                    if (match := self.re_func.fullmatch(out.clean)):
-                        gdict = match.groupdict()
-                        if gdict:
-                            if (func := self.find_function(gdict["func"])):
-                                # hooray we have a function!
-                                ready_fun = func(self, gdict['func'], remaining[i+1:])
-                                ready_fun.execute()
-                                called_func = True
-                                # the function's output will replace everything that lead up to its calling.
-                                out = ready_fun.output
-                                remaining = ready_fun.remaining
-                                i = -1
-                            else:
-                                if called_recursively:
-                                    notfound_fun = NotFoundFunction(self, gdict['func'], remaining[i+1:])
-                                    notfound_fun.execute()
-                                    out = notfound_fun.output
-                                    remaining = notfound_fun.remaining
-                                    i = -1
-                                called_func = True
-                elif c == '(' and not functions:
-                    nest_depth += 1
-                    out += c
-                elif c == ')' and nest_depth > 0:
-                    nest_depth -= 1
-                    out += c
-                else:
-                    out += c
-
-        # if we reach down here, then we are doing well and can pop a frame off.
-        if not noeval:
-            self.stack.pop(-1)
-            if self.stack:
-                self.frame = self.stack[-1]
-
-        # If stopped was never set, then we ended because we reached EOL.
-        if stopped is None and remaining:
-            remaining = ''
-
-        return out, remaining, stopped
+        program = compile_softcode(text, ''.join(stop_at) if stop_at else '', recurse, substitute, functions,
+                                   curly_literals, called_recursively, self.function_recursion_limit)
+        if noeval:
+            out = list()
+            for node in program.nodes:
+                node.evaluate(self, out)
+            out = self.join(out)
+        else:
+            out = self.run(program.nodes, localize=localize, executor=executor, number_args=number_args)
+        return out, text[program.end:], program.stopped
+
+
+Parser.substitutions.update({
+    '#': sub_enactor,
+    'n': sub_name,
+    'N': sub_name,
+    'a': sub_ansi,
+    'r': sub_newline,
+    'R': sub_newline,
+    't': sub_tab,
+    'T': sub_tab,
+    'b': sub_space,
+    'B': sub_space,
+    'l': sub_location,
+    'L': sub_location,
+    'q': sub_register,
+})
+Parser.substitutions.update({str(i): sub_number_arg for i in range(10)})
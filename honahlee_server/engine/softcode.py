@@ -0,0 +1,324 @@
+"""
+Compiles softcode into a tree of nodes that Parser walks, so the same code doesn't have to be
+lexed again every time it runs.
+"""
+import re
+import sys
+from functools import lru_cache
+from typing import Optional, Tuple
+
+
+class Node:
+    __slots__ = ()
+
+    def evaluate(self, parser, out):
+        """
+        Appends this node's output to out, a list of str and rich Text spans that Parser joins
+        once the frame is done.
+        """
+        raise NotImplementedError
+
+
+class Literal(Node):
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def evaluate(self, parser, out):
+        out.append(self.text)
+
+
+class Substitution(Node):
+    __slots__ = ("code", "arg")
+
+    def __init__(self, code: str, arg=None):
+        # code is the character after the %. arg is the register name for %q, or the number for
+        # %0 through %9.
+        self.code = code
+        self.arg = arg
+
+    def evaluate(self, parser, out):
+        out.append(parser.eval_sub(self.code, self.arg))
+
+
+class IterToken(Node):
+    __slots__ = ("code",)
+
+    def __init__(self, code: str):
+        # '#' for ## (the current element) or '@' for #@ (its position).
+        self.code = code
+
+    def evaluate(self, parser, out):
+        out.append(parser.iter_value(self.code))
+
+
+class Bracket(Node):
+    __slots__ = ("body",)
+
+    def __init__(self, body: Tuple[Node, ...]):
+        self.body = body
+
+    def evaluate(self, parser, out):
+        out.append(parser.run(self.body))
+
+
+class NestingLimit(Node):
+    """
+    Stands in for a bracket or function call nested too deeply to compile.
+    """
+    __slots__ = ()
+
+    def evaluate(self, parser, out):
+        out.append(parser.abort('recursion', "#-1 FUNCTION RECURSION LIMIT EXCEEDED"))
+
+
+class FunctionCall(Node):
+    __slots__ = ("prefix", "bangs", "name", "key", "args", "sources", "closed", "strict")
+
+    def __init__(self, prefix: str, bangs: str, name: str, args: Tuple[Tuple[Node, ...], ...],
+                 sources: Tuple[str, ...], closed: bool, strict: bool):
+        # prefix is the function name exactly as it was written, bangs and all.
+        self.prefix = prefix
+        self.bangs = bangs
+        self.name = name
+        # What the function is looked up by.
+        self.key = sys.intern(name.lower())
+        # One compiled body per argument, along with the source text it was compiled from.
+        self.args = args
+        self.sources = sources
+        self.closed = closed
+        # Strict calls are inside [] or another function's arguments, where an unknown function
+        # is an error instead of plain text.
+        self.strict = strict
+
+    def evaluate(self, parser, out):
+        if (output := parser.call_function(self)) is not None:
+            out.append(output)
+            return
+        out.append(self.prefix)
+        out.append("(")
+        for i, arg in enumerate(self.args):
+            if i:
+                out.append(",")
+            for node in arg:
+                node.evaluate(parser, out)
+        if self.closed:
+            out.append(")")
+
+
+class Program:
+    __slots__ = ("nodes", "end", "stopped")
+
+    def __init__(self, nodes: Tuple[Node, ...], end: int, stopped: Optional[str]):
+        self.nodes = nodes
+        # Offset just past whatever was consumed, and the stop character that ended it, if any.
+        self.end = end
+        self.stopped = stopped
+
+
+# The prefixes a function name may carry. Parser applies them to the function's output with
+# functions.base.apply_bangs().
+BANGS = frozenset(('', '!', '!!', '!$', '!!$', '!^', '!!^'))
+
+
+class Compiler:
+    # What can follow a % to make a substitution. Anything else leaves the % as it is.
+    re_sub = re.compile(r"[\w#!@~+:?=&$]")
+    # The register after a %q: either a single character or a name in <>.
+    re_q = re.compile(r"<(?P<named>\w+)>|(?P<old>[A-Za-z0-9])")
+
+    # What each opening bracket is closed by, for skip_nested().
+    closers = {'[': ']', '(': ')', '{': '}'}
+
+    def __init__(self, text: str, recurse=True, substitute=True, functions=True, curly_literals=True,
+                 nesting_limit=50):
+        self.text = text
+        self.i = 0
+        # How deeply brackets and function calls may nest within each other. Anything deeper
+        # compiles to a NestingLimit, so that no input can exhaust Python's recursion limit.
+        self.nesting_limit = nesting_limit
+        self.depth = 0
+        self.recurse = recurse
+        self.substitute = substitute
+        self.functions = functions
+        self.curly_literals = curly_literals
+
+    def expression(self, stop_at: str, strict: bool):
+        """
+        Compiles from the current position until a character in stop_at (outside of any nesting)
+        or the end of the text.
+
+        Returns:
+            nodes (tuple), stopped (str or None)
+        """
+        text = self.text
+        n = len(text)
+        nodes = list()
+        buf = list()
+        # A function call is only recognized at the first ( of an expression, and only when
+        # everything before it is plain, unescaped text that could be a function name.
+        ident = True
+        paren_depth = 0
+        curly_depth = 0
+        stopped = None
+
+        while self.i < n:
+            c = text[self.i]
+            if c == '\\':
+                self.i += 1
+                if self.i < n:
+                    buf.append(text[self.i])
+                    self.i += 1
+                ident = False
+            elif c == '{' and self.curly_literals:
+                # The outermost braces are removed. Everything within them is left unevaluated.
+                if curly_depth:
+                    buf.append(c)
+                curly_depth += 1
+                self.i += 1
+                ident = False
+            elif c == '}' and curly_depth:
+                curly_depth -= 1
+                if curly_depth:
+                    buf.append(c)
+                self.i += 1
+            elif curly_depth:
+                buf.append(c)
+                self.i += 1
+            elif c in stop_at and not paren_depth:
+                self.i += 1
+                stopped = c
+                break
+            elif c == '%' and self.substitute:
+                if self.i + 1 < n and self.re_sub.match(text, self.i + 1):
+                    if buf:
+                        nodes.append(Literal(''.join(buf)))
+                        buf.clear()
+                    nodes.append(self.substitution())
+                else:
+                    buf.append(c)
+                    self.i += 1
+                ident = False
+            elif c == '#' and self.substitute and self.i + 1 < n and text[self.i + 1] in '#@':
+                if buf:
+                    nodes.append(Literal(''.join(buf)))
+                    buf.clear()
+                nodes.append(IterToken(text[self.i + 1]))
+                self.i += 2
+                ident = False
+            elif c == '[' and self.recurse:
+                if buf:
+                    nodes.append(Literal(''.join(buf)))
+                    buf.clear()
+                self.i += 1
+                if self.depth >= self.nesting_limit:
+                    nodes.append(NestingLimit())
+                    self.skip_nested(']')
+                else:
+                    self.depth += 1
+                    body, _ = self.expression(']', True)
+                    self.depth -= 1
+                    nodes.append(Bracket(body))
+                ident = False
+            elif c == '(' and ident and self.functions and (call := self.function_name(buf)):
+                self.i += 1
+                if self.depth >= self.nesting_limit:
+                    nodes.append(NestingLimit())
+                    self.skip_nested(')')
+                else:
+                    self.depth += 1
+                    nodes.append(self.function_call(''.join(buf), *call, strict))
+                    self.depth -= 1
+                buf.clear()
+                ident = False
+            else:
+                if c == '(':
+                    paren_depth += 1
+                    ident = False
+                elif c == ')' and paren_depth:
+                    paren_depth -= 1
+                elif ident and not (c.isalnum() or c in '_!$^'):
+                    ident = False
+                buf.append(c)
+                self.i += 1
+
+        if buf:
+            nodes.append(Literal(''.join(buf)))
+        return tuple(nodes), stopped
+
+    def substitution(self):
+        """
+        Compiles the substitution at the current %.
+        """
+        code = self.text[self.i + 1]
+        self.i += 2
+        if code.isdigit():
+            return Substitution(code, int(code))
+        if code in 'qQ':
+            if (match := self.re_q.match(self.text, self.i)):
+                self.i = match.end()
+                return Substitution('q', (match.group('named') or match.group('old')).upper())
+            return Substitution('q', '')
+        return Substitution(code)
+
+    def skip_nested(self, close: str):
+        """
+        Moves past the close matching an opening that was just consumed, without compiling
+        anything in between.
+        """
+        text = self.text
+        n = len(text)
+        expected = [close]
+        while self.i < n and expected:
+            c = text[self.i]
+            self.i += 1
+            if c == '\\':
+                self.i += 1
+            elif c == expected[-1]:
+                expected.pop()
+            elif c in self.closers:
+                expected.append(self.closers[c])
+
+    @staticmethod
+    def function_name(buf):
+        """
+        Splits buf, known to hold only word characters and bangs, into bangs and a function name.
+
+        Returns:
+            (bangs, name) or None if it isn't a function name.
+        """
+        prefix = ''.join(buf)
+        name = prefix.lstrip('!$^')
+        if not name or (bangs := prefix[:len(prefix) - len(name)]) not in BANGS or '!' in name \
+                or '$' in name or '^' in name:
+            return None
+        return bangs, name
+
+    def function_call(self, prefix: str, bangs: str, name: str, strict: bool):
+        args = list()
+        sources = list()
+        stopped = ','
+        while stopped == ',':
+            start = self.i
+            body, stopped = self.expression(',)', True)
+            args.append(body)
+            sources.append(self.text[start:self.i - 1 if stopped else self.i])
+        if len(args) == 1 and not sources[0]:
+            # name() is a call with no arguments, not one empty argument.
+            args.clear()
+            sources.clear()
+        return FunctionCall(prefix, bangs, name, tuple(args), tuple(sources), stopped == ')', strict)
+
+
+@lru_cache(maxsize=4096)
+def compile_softcode(text: str, stop_at: str = '', recurse=True, substitute=True, functions=True,
+                     curly_literals=True, strict=False, nesting_limit=50) -> Program:
+    """
+    Compiles text up to the first character in stop_at. Results are cached by their arguments, so
+    code that is run over and over again is only compiled once.
+    """
+    compiler = Compiler(text, recurse=recurse, substitute=substitute, functions=functions,
+                        curly_literals=curly_literals, nesting_limit=nesting_limit)
+    nodes, stopped = compiler.expression(stop_at, strict)
+    return Program(nodes, compiler.i, stopped)
@@ -0,0 +1,67 @@
+"""
+Runs softcode for QueueEntries flagged offload in worker processes, so big computations can use
+more than one core. Workers see read-only snapshots of the objects involved and record what they
+would have done as intents, which CmdQueue applies back on the event loop once they finish.
+"""
+import time
+from .parser import Parser
+
+
+class ObjectSnapshot:
+    __slots__ = ("objid", "text", "name", "relations", "intents")
+
+    def __init__(self, objid: str, text: str, name: str, relations=None):
+        self.objid = objid
+        # What str() gives for the live object, such as for %#.
+        self.text = text
+        self.name = name
+        self.relations = relations if relations is not None else dict()
+        self.intents = None
+
+    @classmethod
+    def from_obj(cls, obj, depth: int = 1):
+        relations = dict()
+        if depth and (loc := obj.relations.get('location')):
+            relations['location'] = cls.from_obj(loc, depth - 1)
+        return cls(obj.objid, str(obj), obj.name, relations)
+
+    def __str__(self):
+        return self.text
+
+    def msg(self, text=None, **kwargs):
+        self.intents.append(('msg', self.objid, text, kwargs))
+
+
+class CoreSnapshot:
+    __slots__ = ("functions", "objects")
+
+    def __init__(self, functions, objects):
+        self.functions = functions
+        self.objects = objects
+
+
+def evaluate_offloaded(core: CoreSnapshot, enactor: str, actions):
+    """
+    Evaluates each action as softcode, the way think does, and returns the intents gathered
+    along the way. Actions are bare expressions, though a leading think is allowed and
+    removed. No other commands can run here. This runs in a worker process.
+
+    Returns:
+        intents (list of (kind, objid, text, kwargs)), wall time (float), CPU time (float)
+    """
+    intents = list()
+    for obj in core.objects.values():
+        obj.intents = intents
+    obj = core.objects[enactor]
+    parser = Parser(core, obj, obj, obj)
+    started = time.perf_counter()
+    parser.cpu_start = time.process_time()
+    for action in actions:
+        if action[:6].lower() == 'think ':
+            action = action[6:]
+        result, remaining, stopped = parser.evaluate(action)
+        if result:
+            obj.msg(text=result)
+        if parser.aborted:
+            break
+    return intents, time.perf_counter() - started, time.process_time() - parser.cpu_start